@@ -0,0 +1,427 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import statistics
+import sys
+import time
+import typing
+from typing import Any, Callable, Iterable, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is not measured there
+    resource = None
+
+import numpy
+
+from Config import Config
+from MazeFinisher import MazeFinisher
+from TemplateTile.Predefined import create_default_ruleset, load_default_ruleset, place_big_room_entrances
+from Tile import ContradictionError
+from WFC import WaveFunctionCollapse
+
+if typing.TYPE_CHECKING:
+    from Renderer import Renderer
+
+# Results the benchmarks are compared against, measured on the machine that last updated it
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# How much worse than the baseline a result may be before it counts as a regression, relative to the baseline
+DEFAULT_TOLERANCE = 0.25
+# Peak memory is read from the resident set size, which moves in steps of pages and allocator arenas
+PEAK_MEMORY_SLACK = 4 * 1024 * 1024
+# The seeds of a case are run again until the runs took this long together, so short cases get enough runs to take
+# the median of
+MIN_MEASURED_SECONDS = 2.0
+# The speed of the machine changes within seconds, so the calibration workload is timed in short slices during the
+# runs, every this many seconds, and this often right before and after each run for the runs that are over before
+CALIBRATION_INTERVAL = 0.01
+CALIBRATION_REPEATS = 4
+CALIBRATION_ITERATIONS = 500
+
+
+class BenchmarkCase:
+    """
+    Something to measure, run once per seed and repeated until MIN_MEASURED_SECONDS. Only run is timed, the state it
+    needs is built by setup beforehand
+    """
+
+    def __init__(self, name: str, setup: Callable[[int], Any], run: Callable[[Any], None], seeds: Iterable[int], *,
+                 cells: int = 0, calibrated: bool = True, tolerance: float = DEFAULT_TOLERANCE, description: str = ""):
+        """
+        :param setup: Builds the state of a run from its seed
+        :param run: The measured part. If the state has a contradictions attribute, it is read afterwards
+        :param cells: Amount of tiles a single run handles, 0 if the case is not about tiles
+        :param calibrated: Whether the throughput is compared relative to the calibration workload. Only for cases
+            that mostly run Python code, which gets slower and faster together with it
+        :param tolerance: How much worse than the baseline the case may be, see find_regressions
+        """
+
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.seeds = list(seeds)
+        self.cells = cells
+        self.calibrated = calibrated
+        self.tolerance = tolerance
+        self.description = description
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, runs: int, seconds: float, median_seconds: float, cells: int, contradictions: int,
+                 failures: int, peak_bytes: Optional[int], relative_seconds: Optional[float]):
+        """
+        :param seconds: Time spent in all runs together
+        :param median_seconds: Median time of a run, which a few runs disturbed by whatever else runs on the machine
+            don't move
+        :param cells: Tiles handled in all runs together
+        :param failures: Runs that ended in a contradiction the solver could not recover from
+        :param peak_bytes: How much the peak memory of the process grew during the runs, None if it is not known
+        :param relative_seconds: Median time of a run in slices of the calibration workload timed during it, which
+            stays the same when the whole machine gets slower or faster. None if the case is not calibrated
+        """
+
+        self.name = name
+        self.runs = runs
+        self.seconds = seconds
+        self.median_seconds = median_seconds
+        self.cells = cells
+        self.contradictions = contradictions
+        self.failures = failures
+        self.peak_bytes = peak_bytes
+        self.relative_seconds = relative_seconds
+
+    @property
+    def seconds_per_run(self) -> float:
+        return self.seconds / self.runs
+
+    @property
+    def cells_per_second(self) -> Optional[float]:
+        return self.cells / self.seconds if self.cells else None
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: Cells per second of the median run, or runs per second for the cases that are not about tiles
+        """
+
+        return (self.cells / self.runs or 1) / self.median_seconds
+
+    @property
+    def relative_throughput(self) -> float:
+        """
+        :return: Cells or runs per slice of the calibration workload, or just the throughput if the case is not
+            calibrated. This is what is compared against the baseline
+        """
+
+        if self.relative_seconds is None:
+            return self.throughput
+
+        return (self.cells / self.runs or 1) / self.relative_seconds
+
+    @property
+    def contradiction_rate(self) -> float:
+        """
+        :return: Contradictions per collapsed tile
+        """
+
+        return self.contradictions / self.cells if self.cells else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "seconds": self.seconds,
+            "median_seconds": self.median_seconds,
+            "cells": self.cells,
+            "contradictions": self.contradictions,
+            "failures": self.failures,
+            "peak_bytes": self.peak_bytes,
+            "relative_seconds": self.relative_seconds
+        }
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> 'BenchmarkResult':
+        return cls(name, data["runs"], data["seconds"], data["median_seconds"], data["cells"], data["contradictions"],
+                   data["failures"], data["peak_bytes"], data["relative_seconds"])
+
+    def __repr__(self):
+        return f"BenchmarkResult<name: {self.name}, runs: {self.runs}, seconds: {self.seconds:.3f}>"
+
+
+def get_peak_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes everywhere but on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def calibrate() -> float:
+    """
+    Time a fixed workload of plain Python integer, list and dict operations, like most of the solver is made of
+
+    :return: Seconds the workload took
+    """
+
+    start = time.perf_counter()
+    values: dict[int, int] = {}
+    queue = []
+    total = 0
+
+    for i in range(CALIBRATION_ITERATIONS):
+        total = (total + i * 7) & 0xFFFF
+        values[total & 1023] = i
+        queue.append(total)
+
+        if len(queue) > 64:
+            queue.pop(0)
+
+    return time.perf_counter() - start
+
+
+def setup_solver(size: int) -> Callable[[int], WaveFunctionCollapse]:
+    def setup(seed: int) -> WaveFunctionCollapse:
+        wfc = WaveFunctionCollapse(load_default_ruleset(), width=size, height=size, rng=random.Random(seed))
+        place_big_room_entrances(wfc)
+        return wfc
+
+    return setup
+
+
+# seed -> (domains, templates, collapsed) of a collapsed grid, so the finisher runs don't each collapse their own
+solved_grids: dict[int, tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = {}
+
+
+def setup_finisher(seed: int) -> MazeFinisher:
+    wfc = setup_solver(200)(seed)
+
+    if seed not in solved_grids:
+        wfc.run()
+        solved_grids[seed] = wfc.domains.copy(), wfc.templates.copy(), wfc.collapsed.copy()
+    else:
+        wfc.load_state(*solved_grids[seed])
+        wfc.is_finished = True
+
+    return MazeFinisher(wfc)
+
+
+def setup_frame(seed: int) -> Renderer:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+
+    from Renderer import Renderer
+
+    pygame.init()
+    screen = pygame.display.get_surface() or pygame.display.set_mode((Config.SW, Config.SH))
+
+    wfc = setup_solver(Config.SW // Config.CW)(seed)
+    wfc.run()
+    maze_finisher = MazeFinisher(wfc)
+    maze_finisher.run()
+
+    renderer = Renderer(screen, wfc, maze_finisher)
+    # The first frame also draws the sprites
+    renderer.draw()
+    return renderer
+
+
+# Frames drawn per run, a single one is over too quickly to time reliably
+FRAMES_PER_RUN = 10
+
+
+def draw_frames(renderer: Renderer):
+    for _ in range(FRAMES_PER_RUN):
+        renderer.draw_all()
+
+
+def get_cases() -> list[BenchmarkCase]:
+    def solver_case(size: int, seeds: Iterable[int]) -> BenchmarkCase:
+        return BenchmarkCase(f"solver-{size}", setup_solver(size), WaveFunctionCollapse.run, seeds, cells=size * size,
+                             description=f"Collapse a {size}x{size} grid with the big rooms")
+
+    return [
+        BenchmarkCase("ruleset", lambda _: None, lambda _: create_default_ruleset(), range(5),
+                      description="Define the special tiles, construct the maze tiles and compile, without cache"),
+        solver_case(40, range(20)),
+        solver_case(200, range(3)),
+        solver_case(1000, range(1)),
+        BenchmarkCase("finisher-200", setup_finisher, MazeFinisher.run, range(3),
+                      cells=200 * 200, description="Finish a collapsed 200x200 grid"),
+        BenchmarkCase("frame", setup_frame, draw_frames, range(20),
+                      cells=Config.SW // Config.CW * Config.SH // Config.CH * FRAMES_PER_RUN, calibrated=False,
+                      description="Draw a whole frame of a finished grid"),
+    ]
+
+
+class Calibration:
+    """
+    Times slices of the calibration workload from a timer signal while a run is going, where the platform has one
+    """
+
+    def __init__(self):
+        self.samples: list[float] = []
+        # Time spent in the slices taken during the run, which is not part of the run
+        self.interrupted = 0.0
+
+    def sample(self, *_):
+        start = time.perf_counter()
+        self.samples.append(calibrate())
+        self.interrupted += time.perf_counter() - start
+
+    def __enter__(self) -> 'Calibration':
+        self.samples = [calibrate() for _ in range(CALIBRATION_REPEATS)]
+        self.interrupted = 0.0
+
+        if hasattr(signal, "setitimer"):
+            signal.signal(signal.SIGALRM, self.sample)
+            signal.setitimer(signal.ITIMER_REAL, CALIBRATION_INTERVAL, CALIBRATION_INTERVAL)
+
+        return self
+
+    def __exit__(self, *_):
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+        self.samples += [calibrate() for _ in range(CALIBRATION_REPEATS)]
+
+    @property
+    def seconds(self) -> float:
+        """
+        :return: Mean time of a slice while the run was going
+        """
+
+        return statistics.fmean(self.samples)
+
+
+def measure(case_name: str) -> BenchmarkResult:
+    """
+    Run every seed of a case in the current process, again and again until MIN_MEASURED_SECONDS. Calibrated runs are
+    timed in slices of the calibration workload timed during them, see Calibration
+    """
+
+    case = next(case for case in get_cases() if case.name == case_name)
+    run_seconds, relative_seconds = [], []
+    contradictions = failures = 0
+    peak_before = None
+
+    while sum(run_seconds) < MIN_MEASURED_SECONDS:
+        for seed in case.seeds:
+            state = case.setup(seed)
+
+            if peak_before is None:
+                peak_before = get_peak_bytes()
+
+            calibration = Calibration() if case.calibrated else contextlib.nullcontext()
+
+            with calibration:
+                start = time.perf_counter()
+
+                try:
+                    case.run(state)
+                except ContradictionError:
+                    failures += 1
+
+                seconds = time.perf_counter() - start
+
+            if case.calibrated:
+                seconds -= calibration.interrupted
+                relative_seconds.append(seconds / calibration.seconds)
+
+            run_seconds.append(seconds)
+            contradictions += getattr(state, "contradictions", 0)
+
+    peak_after = get_peak_bytes()
+    peak_bytes = None if peak_before is None or peak_after is None else peak_after - peak_before
+
+    return BenchmarkResult(case.name, len(run_seconds), sum(run_seconds), statistics.median(run_seconds),
+                           case.cells * len(run_seconds), contradictions, failures, peak_bytes,
+                           statistics.median(relative_seconds) if relative_seconds else None)
+
+
+def run_benchmarks(names: Optional[Iterable[str]] = None) -> Iterable[BenchmarkResult]:
+    """
+    Run the cases one after the other, each in a fresh process so their peak memory is measured separately
+
+    :param names: The cases to run, all of them by default
+    """
+
+    names = [case.name for case in get_cases()] if names is None else list(names)
+    context = multiprocessing.get_context("spawn")
+
+    for name in names:
+        with context.Pool(1) as pool:
+            result = pool.apply(measure, (name,))
+            # Terminating the worker can hang once it opened a display
+            pool.close()
+            pool.join()
+
+        yield result
+
+
+def get_machine() -> dict:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count()
+    }
+
+
+def load_baseline(path: str = BASELINE_PATH) -> tuple[dict, dict[str, BenchmarkResult]]:
+    """
+    :return: (machine the baseline was measured on, case name -> result)
+    """
+
+    with open(path) as file:
+        data = json.load(file)
+
+    return data["machine"], {name: BenchmarkResult.from_dict(name, result) for name, result in data["results"].items()}
+
+
+def save_baseline(results: Iterable[BenchmarkResult], path: str = BASELINE_PATH):
+    data = {
+        "machine": get_machine(),
+        "results": {result.name: result.to_dict() for result in results}
+    }
+
+    with open(path, "w") as file:
+        json.dump(data, file, indent=4)
+        file.write("\n")
+
+
+def find_regressions(result: BenchmarkResult, baseline: BenchmarkResult,
+                     tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """
+    :return: What got worse than the baseline by more than the tolerance, empty if nothing did
+    """
+
+    regressions = []
+
+    if result.relative_throughput < baseline.relative_throughput * (1 - tolerance):
+        regressions.append(f"{result.name}: throughput dropped by "
+                           f"{1 - result.relative_throughput / baseline.relative_throughput:.0%}")
+
+    if result.peak_bytes is not None and baseline.peak_bytes is not None and \
+            result.peak_bytes > baseline.peak_bytes * (1 + tolerance) + PEAK_MEMORY_SLACK:
+        regressions.append(f"{result.name}: peak memory grew from {baseline.peak_bytes / 2 ** 20:.1f}MB to "
+                           f"{result.peak_bytes / 2 ** 20:.1f}MB")
+
+    # The seeds are fixed, so the contradictions only change with the solver itself
+    if result.contradiction_rate > baseline.contradiction_rate * (1 + tolerance) + 1e-4:
+        regressions.append(f"{result.name}: contradiction rate rose from {baseline.contradiction_rate:.4%} to "
+                           f"{result.contradiction_rate:.4%}")
+
+    if result.failures > baseline.failures:
+        regressions.append(f"{result.name}: {result.failures} failed runs, {baseline.failures} in the baseline")
+
+    return regressions
@@ -0,0 +1,89 @@
+import argparse
+import sys
+
+from Benchmark import BASELINE_PATH, DEFAULT_TOLERANCE, BenchmarkResult, find_regressions, get_cases, get_machine, \
+    load_baseline, run_benchmarks, save_baseline
+
+
+def format_result(result: BenchmarkResult, baseline: BenchmarkResult = None) -> str:
+    cells_per_second = "-" if result.cells_per_second is None else f"{result.cells_per_second:,.0f}"
+    peak = "-" if result.peak_bytes is None else f"{result.peak_bytes / 2 ** 20:.1f}"
+    change = "-" if baseline is None else f"{result.relative_throughput / baseline.relative_throughput - 1:+.1%}"
+
+    return f"{result.name:<14}{result.runs:>5}{result.seconds_per_run:>10.4f}{result.median_seconds:>10.4f}" \
+           f"{cells_per_second:>14}{peak:>10}{result.contradiction_rate:>12.4%}{result.failures:>7}{change:>10}"
+
+
+def main():
+    cases = get_cases()
+
+    parser = argparse.ArgumentParser(
+        prog="python -m Benchmark",
+        description="Benchmark the solver, ruleset builder, finisher and renderer and compare them to a baseline"
+    )
+    parser.add_argument("cases", nargs="*", choices=[[]] + [case.name for case in cases],
+                        help="The cases to run, all by default")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline to compare against")
+    parser.add_argument("--tolerance", type=float,
+                        help="How much worse than the baseline a result may be, relative to the baseline. Overrides "
+                             "the tolerance of every case, which is mostly " + str(DEFAULT_TOLERANCE))
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store the results as the new baseline instead of comparing against it")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for case in cases:
+            print(f"{case.name:<14}{case.description}")
+        return
+
+    baseline = {}
+
+    if not args.update_baseline:
+        try:
+            machine, baseline = load_baseline(args.baseline)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}, run with --update-baseline to create one", file=sys.stderr)
+        else:
+            if machine != get_machine():
+                print(f"The baseline was measured on a different machine: {machine}", file=sys.stderr)
+
+    print(f"{'case':<14}{'runs':>5}{'s/run':>10}{'median':>10}{'cells/s':>14}{'peak MB':>10}{'contr.':>12}{'fails':>7}"
+          f"{'change':>10}")
+
+    results = []
+    regressions = []
+
+    for result in run_benchmarks(args.cases or None):
+        results.append(result)
+        print(format_result(result, baseline.get(result.name)), flush=True)
+
+        if result.name in baseline:
+            tolerance = next(case.tolerance for case in cases if case.name == result.name) \
+                if args.tolerance is None else args.tolerance
+            regressions += find_regressions(result, baseline[result.name], tolerance)
+
+    if args.update_baseline:
+        if args.cases:
+            # Keep the cases that were not run this time
+            try:
+                results = list(load_baseline(args.baseline)[1].values()) + results
+                results = list({result.name: result for result in results}.values())
+            except FileNotFoundError:
+                pass
+
+        save_baseline(results, args.baseline)
+        print(f"Saved the baseline to {args.baseline}", file=sys.stderr)
+        return
+
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:", file=sys.stderr)
+
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
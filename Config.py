@@ -1,5 +1,19 @@
+import os
+
+
 class Config:
     SW, SH = 1000, 1000
     CW, CH = 25, 25
     FPS = 600
     SEED = 105
+    # How long every frame of the visualizer may spend solving and finishing
+    STEP_BUDGET_MS = 12
+    # How many decisions may be undone to recover from a single contradiction, and how often per run
+    BACKTRACK_DEPTH = 8
+    MAX_RECOVERIES = 100
+    # Where compiled rulesets are cached between runs, next to the project so it is found from any directory, None
+    # disables the cache
+    RULESET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ruleset_cache")
+    # Side length of a world chunk in tiles and how much memory the cached chunks may use
+    CHUNK_SIZE = 32
+    CHUNK_CACHE_BYTES = 64 * 1024 * 1024
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy
+
+from Config import Config
+from Generator import Maze, generate
+from TemplateTile import Ruleset, TemplateTileManager, compile_ruleset
+from TemplateTile.Predefined import load_default_ruleset
+from TemplateTile.RulesetCache import get_ruleset_hash, load_ruleset, save_ruleset
+
+# The ruleset of the current worker process, loaded once by init_worker
+worker_ruleset: Optional[Ruleset] = None
+
+
+class Job:
+    def __init__(self, width: int, height: int, seed: Optional[int] = None, *, big_rooms: bool = True):
+        """
+        :param seed: Seed of this job, derived from the root seed and the index of the job if not given
+        """
+
+        self.width, self.height = width, height
+        self.seed = seed
+        self.big_rooms = big_rooms
+
+    def __repr__(self):
+        return f"Job<width: {self.width}, height: {self.height}, seed: {self.seed}>"
+
+
+def derive_seed(root_seed: int, index: int) -> int:
+    """
+    Derive the seed of a job from the root seed, independent of which worker runs it and when
+    """
+
+    digest = hashlib.sha256(f"{root_seed}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def init_worker(ruleset_path: Optional[str]):
+    global worker_ruleset
+    worker_ruleset = load_default_ruleset() if ruleset_path is None else load_ruleset(ruleset_path)
+
+
+def get_worker_ruleset() -> Ruleset:
+    return worker_ruleset
+
+
+@contextlib.contextmanager
+def export_ruleset(ruleset: Optional[Union[Ruleset, TemplateTileManager]]) -> Iterator[tuple[Ruleset, Optional[str]]]:
+    """
+    Make a ruleset available to worker processes started with init_worker
+
+    :param ruleset: The ruleset, None for the predefined ruleset which every worker loads from the on-disk cache
+    :return: (compiled ruleset, path to pass to init_worker)
+    """
+
+    if ruleset is None:
+        yield load_default_ruleset(), None
+        return
+
+    # Workers memory-map the ruleset instead of receiving a pickled copy
+    ruleset = compile_ruleset(ruleset)
+    file, ruleset_path = tempfile.mkstemp(suffix=".bin")
+    os.close(file)
+
+    try:
+        save_ruleset(ruleset, ruleset_path, get_ruleset_hash(ruleset))
+        yield ruleset, ruleset_path
+    finally:
+        os.remove(ruleset_path)
+
+
+def run_job(job: tuple[int, int, int, int, bool]) -> tuple[int, int, int, int, str, bytes, bytes]:
+    index, width, height, seed, big_rooms = job
+    maze = generate(width, height, seed, worker_ruleset, big_rooms=big_rooms)
+
+    # Sent back as raw bytes, which is a lot smaller and faster to pickle than template tiles
+    return index, seed, width, height, maze.template_ids.dtype.str, maze.template_ids.tobytes(), \
+        numpy.packbits(maze.visited).tobytes()
+
+
+def generate_batch(jobs: Iterable[Job], *, root_seed: int = Config.SEED, workers: Optional[int] = None,
+                   ruleset: Optional[Union[Ruleset, TemplateTileManager]] = None, ordered: bool = False,
+                   chunksize: int = 1) -> Iterator[tuple[int, Maze]]:
+    """
+    Generate many mazes across a pool of worker processes. Every job owns its random number generator, so job i
+    always produces the same maze for the same root seed, no matter the amount of workers or the order they finish in
+
+    :param jobs: The mazes to generate
+    :param root_seed: Seed the seeds of the jobs without an explicit seed are derived from
+    :param workers: Amount of worker processes, defaults to the amount of cores. 1 generates in this process
+    :param ruleset: The template tiles to generate with, defaults to the predefined ruleset
+    :param ordered: Yield the mazes in the order of the jobs instead of as soon as they are done
+    :param chunksize: How many jobs are sent to a worker at once
+    :return: (index of the job, maze) as the mazes are finished
+    """
+
+    tasks = (
+        (index, job.width, job.height, derive_seed(root_seed, index) if job.seed is None else job.seed,
+         job.big_rooms)
+        for index, job in enumerate(jobs)
+    )
+
+    if workers == 1:
+        ruleset = load_default_ruleset() if ruleset is None else compile_ruleset(ruleset)
+
+        for index, width, height, seed, big_rooms in tasks:
+            yield index, generate(width, height, seed, ruleset, big_rooms=big_rooms)
+
+        return
+
+    with export_ruleset(ruleset) as (ruleset, ruleset_path):
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(ruleset_path,)) as pool:
+            if ordered:
+                results = pool.imap(run_job, tasks, chunksize)
+            else:
+                results = pool.imap_unordered(run_job, tasks, chunksize)
+
+            for index, seed, width, height, dtype, data, visited in results:
+                visited = numpy.unpackbits(numpy.frombuffer(visited, dtype=numpy.uint8), count=width * height)
+                yield index, Maze(width, height, seed, ruleset, numpy.frombuffer(data, dtype=dtype),
+                                  visited.view(numpy.bool_))
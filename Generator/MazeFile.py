@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from typing import BinaryIO, Iterator, Optional, Union
+
+import numpy
+
+from Generator import Maze
+from TemplateTile import Ruleset
+from TemplateTile.Predefined import load_default_ruleset
+from TemplateTile.RulesetCache import get_ruleset_hash
+
+MAGIC = b"WFCM"
+# Bump when the layout of the file changes
+FORMAT_VERSION = 1
+
+# magic, format version, flags, bytes per template id, width, height, seed, hash of the ruleset
+HEADER = struct.Struct("<4sHBBIIQ32s")
+
+# The record is followed by the visited layer of the MazeFinisher, one bit per tile
+FLAG_VISITED = 1
+
+
+class MazeFileError(Exception):
+    pass
+
+
+def get_template_dtype(ruleset: Ruleset) -> numpy.dtype:
+    return numpy.dtype(numpy.uint8) if len(ruleset) <= 256 else numpy.dtype("<u2")
+
+
+def get_record_size(width: int, height: int, template_size: int, flags: int) -> int:
+    size = HEADER.size + width * height * template_size
+
+    if flags & FLAG_VISITED:
+        size += (width * height + 7) // 8
+
+    return size
+
+
+class MazeWriter:
+    """
+    Writes mazes one after the other into a single file, as they are generated. A file with a single maze is written
+    the same way
+    """
+
+    def __init__(self, file: Union[str, BinaryIO]):
+        """
+        :param file: Path of the file to create, or a binary file object to write to
+        """
+
+        self.owns_file = isinstance(file, str)
+        self.file: BinaryIO = open(file, "wb") if self.owns_file else file
+        self.count = 0
+
+        # Hashing a ruleset takes a while and a batch is usually generated with a single one
+        self.ruleset_hashes: dict[int, tuple[Ruleset, bytes]] = {}
+
+    def get_ruleset_hash(self, ruleset: Ruleset) -> bytes:
+        cached = self.ruleset_hashes.get(id(ruleset))
+
+        if cached is None or cached[0] is not ruleset:
+            cached = self.ruleset_hashes[id(ruleset)] = (ruleset, bytes.fromhex(get_ruleset_hash(ruleset)))
+
+        return cached[1]
+
+    def write(self, maze: Maze):
+        dtype = get_template_dtype(maze.ruleset)
+        flags = FLAG_VISITED if maze.visited is not None else 0
+
+        if not 0 <= maze.seed < 2 ** 64:
+            raise MazeFileError(f"The seed {maze.seed} does not fit into 64 bits")
+
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags, dtype.itemsize, maze.width, maze.height, maze.seed,
+                                    self.get_ruleset_hash(maze.ruleset)))
+        self.file.write(numpy.ascontiguousarray(maze.template_ids, dtype=dtype).tobytes())
+
+        if flags & FLAG_VISITED:
+            self.file.write(numpy.packbits(numpy.asarray(maze.visited, dtype=numpy.bool_)).tobytes())
+
+        self.count += 1
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self) -> 'MazeWriter':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def save_maze(maze: Maze, path: str):
+    with MazeWriter(path) as writer:
+        writer.write(maze)
+
+
+def iter_mazes(path: str, ruleset: Optional[Ruleset] = None) -> Iterator[Maze]:
+    """
+    Memory-map a file written by MazeWriter and read the mazes in it. The template ids of every maze point straight
+    into the mapped file, nothing is parsed or copied until it is read
+
+    :param path: The file to read
+    :param ruleset: The ruleset the mazes were generated with, defaults to the predefined ruleset
+    :raises MazeFileError: If the file is not in this format or was written with a different ruleset
+    """
+
+    if ruleset is None:
+        ruleset = load_default_ruleset()
+
+    ruleset_hash = bytes.fromhex(get_ruleset_hash(ruleset))
+
+    with open(path, "rb") as file:
+        # An empty file can't be mapped, but is a valid file without any mazes
+        if file.seek(0, 2) == 0:
+            return
+
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    offset = 0
+
+    while offset < len(data):
+        if len(data) - offset < HEADER.size:
+            raise MazeFileError(f"{path} is truncated")
+
+        magic, version, flags, template_size, width, height, seed, saved_hash = HEADER.unpack_from(data, offset)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise MazeFileError(f"{path} is not a version {FORMAT_VERSION} maze file")
+        if saved_hash != ruleset_hash:
+            raise MazeFileError(f"{path} was written with a different ruleset")
+        if template_size not in (1, 2):
+            raise MazeFileError(f"{path} has template ids of an unknown size")
+
+        size = get_record_size(width, height, template_size, flags)
+
+        if len(data) - offset < size:
+            raise MazeFileError(f"{path} is truncated")
+
+        tiles = width * height
+        offset += HEADER.size
+        template_ids = numpy.frombuffer(data, dtype=numpy.uint8 if template_size == 1 else "<u2", count=tiles,
+                                        offset=offset)
+        offset += tiles * template_size
+        visited = None
+
+        if flags & FLAG_VISITED:
+            packed = numpy.frombuffer(data, dtype=numpy.uint8, count=(tiles + 7) // 8, offset=offset)
+            visited = numpy.unpackbits(packed, count=tiles).view(numpy.bool_)
+            offset += packed.size
+
+        yield Maze(width, height, seed, ruleset, template_ids, visited)
+
+
+def load_maze(path: str, ruleset: Optional[Ruleset] = None) -> Maze:
+    """
+    Memory-map the first maze of a file written by MazeWriter, see iter_mazes
+    """
+
+    for maze in iter_mazes(path, ruleset):
+        return maze
+
+    raise MazeFileError(f"{path} does not contain a maze")
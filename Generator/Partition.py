@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import random
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Union
+
+import numpy
+
+from Generator import Maze
+from Generator.Batch import export_ruleset, get_worker_ruleset, init_worker
+from MazeFinisher import MazeFinisher
+from TemplateTile import Ruleset, TemplateTileManager
+from TemplateTile.Predefined import load_default_ruleset, place_big_room_entrances
+from Tile import ContradictionError
+from WFC import WaveFunctionCollapse
+
+
+class PartitionReport:
+    def __init__(self, strips: int, workers: int, seconds: float, seam_seconds: float, strip_seconds: list[float],
+                 attempts: list[int]):
+        """
+        :param seconds: Wall clock time of the whole solve
+        :param seam_seconds: CPU time spent solving the seams before the strips were handed out
+        :param strip_seconds: CPU time every strip took in its worker
+        :param attempts: How often every strip had to be solved before it fit between its seams
+        """
+
+        self.strips, self.workers = strips, workers
+        self.seconds = seconds
+        self.seam_seconds = seam_seconds
+        self.strip_seconds = strip_seconds
+        self.attempts = attempts
+
+    @property
+    def serial_seconds(self) -> float:
+        """
+        How long the same work takes on a single core, the CPU time of the seams and every strip
+        """
+
+        return self.seam_seconds + sum(self.strip_seconds)
+
+    @property
+    def speedup(self) -> float:
+        return self.serial_seconds / self.seconds if self.seconds > 0 else 1.0
+
+    def __repr__(self):
+        return (f"PartitionReport<strips: {self.strips}, workers: {self.workers}, seconds: {self.seconds:.2f}, "
+                f"single core: {self.serial_seconds:.2f}, speedup: {self.speedup:.2f}x>")
+
+
+def get_strip_bounds(height: int, strips: int) -> list[tuple[int, int]]:
+    """
+    Split the rows of a grid into strips separated by single seam rows
+
+    :return: (first row, row after the last) of every strip, the row after every strip but the last is a seam
+    """
+
+    if strips < 1 or strips > (height + 1) // 2:
+        raise ValueError(f"Can't split {height} rows into {strips} strips")
+
+    bounds = []
+    start = 0
+
+    for seam in (round(i * height / strips) for i in range(1, strips)):
+        bounds.append((start, seam))
+        start = seam + 1
+
+    bounds.append((start, height))
+    return bounds
+
+
+def solve_strip(ruleset: Ruleset, width: int, top: int, domains: numpy.ndarray, templates: numpy.ndarray,
+                collapsed: numpy.ndarray, seed: int, *, max_attempts: int, backtrack_depth: int,
+                max_recoveries: int) -> tuple[int, float]:
+    """
+    Solve the rows of a strip in place. The rows around the strip are collapsed and already propagated into it, so the
+    strip can be solved on its own
+
+    :param top: Row of the whole grid the strip starts at, only used to report contradictions
+    :return: (attempts needed, CPU seconds taken)
+    """
+
+    start = time.process_time()
+    height = len(domains) // width
+    contradiction = None
+
+    for attempt in range(max_attempts):
+        wfc = WaveFunctionCollapse(ruleset, width, height, backtrack_depth=backtrack_depth,
+                                   max_recoveries=max_recoveries, walls=False, rng=random.Random(f"{seed}:{attempt}"))
+        wfc.load_state(domains, templates, collapsed)
+
+        try:
+            wfc.run()
+        except ContradictionError as error:
+            contradiction = ContradictionError(error.x, error.y + top)
+            continue
+
+        domains[:] = wfc.domains
+        templates[:] = wfc.templates
+        collapsed[:] = wfc.collapsed
+
+        return attempt + 1, time.process_time() - start
+
+    raise contradiction
+
+
+def run_strip(task: tuple) -> tuple[int, int, float]:
+    strip, names, dtypes, size, width, top, bottom, seed, options = task
+    memories = [shared_memory.SharedMemory(name=name) for name in names]
+
+    try:
+        arrays = [
+            numpy.ndarray(size, dtype=dtype, buffer=memory.buf)[top * width:bottom * width]
+            for memory, dtype in zip(memories, dtypes)
+        ]
+        attempts, seconds = solve_strip(get_worker_ruleset(), width, top, *arrays, seed, **options)
+
+        # The shared memory can only be closed once nothing points into it anymore
+        del arrays
+    finally:
+        for memory in memories:
+            memory.close()
+
+    return strip, attempts, seconds
+
+
+def solve_seams(wfc: WaveFunctionCollapse, bounds: list[tuple[int, int]]):
+    seams = [index for _, seam in bounds[:-1] for index in range(seam * wfc.width, (seam + 1) * wfc.width)]
+
+    while seams:
+        for index in seams:
+            if not wfc.collapsed[index]:
+                wfc.solve_tile(index)
+
+        # Recovering from a contradiction may have undone seam tiles that were already collapsed
+        seams = [index for index in seams if not wfc.collapsed[index]]
+
+
+def solve_partitioned(wfc: WaveFunctionCollapse, strips: Optional[int] = None, *, workers: Optional[int] = None,
+                      max_attempts: int = 8) -> PartitionReport:
+    """
+    Solve a single grid across several processes. The grid is split into horizontal strips, the seam rows between
+    them are solved first in this process and the strips are then solved in parallel in shared memory. Every strip is
+    retried with another seed until it fits between its seams
+
+    :param wfc: The solver of the grid, anything already placed in it is kept
+    :param strips: Amount of strips, defaults to the amount of workers
+    :param workers: Amount of worker processes, defaults to the amount of cores. 1 solves the strips in this process
+    :param max_attempts: How often a strip is retried before giving up
+    :return: Timings of the solve, including the speedup over solving it on a single core
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if strips is None:
+        strips = workers
+
+    bounds = get_strip_bounds(wfc.height, strips)
+    start, seam_start = time.perf_counter(), time.process_time()
+
+    solve_seams(wfc, bounds)
+    seam_seconds = time.process_time() - seam_start
+
+    # Drawn up front so the maze is the same no matter the amount of workers
+    seeds = [wfc.rng.getrandbits(64) for _ in bounds]
+    options = {
+        "max_attempts": max_attempts,
+        "backtrack_depth": wfc.backtrack_depth,
+        "max_recoveries": wfc.max_recoveries
+    }
+    results = []
+
+    # Arbitrary sized domains can't be shared between processes
+    if workers == 1 or wfc.domains.dtype == object:
+        for strip, (top, bottom) in enumerate(bounds):
+            rows = slice(top * wfc.width, bottom * wfc.width)
+            results.append((strip, *solve_strip(wfc.ruleset, wfc.width, top, wfc.domains[rows], wfc.templates[rows],
+                                                wfc.collapsed[rows], seeds[strip], **options)))
+
+        wfc.load_state(wfc.domains, wfc.templates, wfc.collapsed)
+    else:
+        arrays = [wfc.domains, wfc.templates, wfc.collapsed]
+        memories = [shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1)) for array in arrays]
+        shared = []
+
+        try:
+            for array, memory in zip(arrays, memories):
+                shared.append(numpy.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf))
+                shared[-1][:] = array
+
+            tasks = [
+                (strip, [memory.name for memory in memories], [array.dtype.str for array in arrays], wfc.size,
+                 wfc.width, top, bottom, seeds[strip], options)
+                for strip, (top, bottom) in enumerate(bounds)
+            ]
+
+            with export_ruleset(wfc.ruleset) as (_, ruleset_path):
+                with multiprocessing.Pool(workers, initializer=init_worker, initargs=(ruleset_path,)) as pool:
+                    results = pool.map(run_strip, tasks)
+
+            wfc.load_state(*shared)
+        finally:
+            shared.clear()
+
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+
+    results.sort()
+    wfc.is_finished = wfc.remaining == 0
+
+    return PartitionReport(
+        strips,
+        workers,
+        time.perf_counter() - start,
+        seam_seconds,
+        [seconds for _, _, seconds in results],
+        [attempts for _, attempts, _ in results]
+    )
+
+
+def generate_partitioned(width: int, height: int, seed: int,
+                         ruleset: Optional[Union[Ruleset, TemplateTileManager]] = None, *,
+                         strips: Optional[int] = None, workers: Optional[int] = None,
+                         big_rooms: bool = True) -> tuple[Maze, PartitionReport]:
+    """
+    Generate and finish a single maze like Generator.generate, solving it with solve_partitioned
+    """
+
+    if ruleset is None:
+        ruleset = load_default_ruleset()
+
+    wfc = WaveFunctionCollapse(ruleset, width=width, height=height, rng=random.Random(seed))
+
+    if big_rooms:
+        place_big_room_entrances(wfc)
+
+    report = solve_partitioned(wfc, strips, workers=workers)
+    maze_finisher = MazeFinisher(wfc)
+    maze_finisher.run()
+
+    return Maze.from_wfc(wfc, seed, maze_finisher.seen), report
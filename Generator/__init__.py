@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import random
+from typing import Optional, Union
+
+import numpy
+
+from MazeFinisher import MazeFinisher
+from TemplateTile import Ruleset, TemplateTile, TemplateTileManager
+from TemplateTile.Predefined import load_default_ruleset, place_big_room_entrances
+from WFC import WaveFunctionCollapse
+
+
+class Maze:
+    def __init__(self, width: int, height: int, seed: int, ruleset: Ruleset, template_ids: numpy.ndarray,
+                 visited: Optional[numpy.ndarray] = None):
+        self.width, self.height = width, height
+        self.seed = seed
+        self.ruleset = ruleset
+        # The template tile id of every tile, indexed by x + y * width
+        self.template_ids = template_ids
+        # Whether the MazeFinisher walked to every tile, if it is known
+        self.visited = visited
+
+    @classmethod
+    def from_wfc(cls, wfc: WaveFunctionCollapse, seed: int, visited: Optional[numpy.ndarray] = None) -> 'Maze':
+        return cls(wfc.width, wfc.height, seed, wfc.ruleset, wfc.templates.copy(),
+                   None if visited is None else visited.copy())
+
+    @property
+    def template_tiles(self) -> list[TemplateTile]:
+        return [self.ruleset.tiles[template_id] for template_id in self.template_ids.tolist()]
+
+    def get_template_tile_at(self, x: int, y: int) -> TemplateTile:
+        return self.ruleset.tiles[self.template_ids[x + y * self.width]]
+
+    def to_dict(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "seed": self.seed,
+            "tiles": [[t.tile_type.name, t.rotation] for t in self.template_tiles]
+        }
+
+    def __repr__(self):
+        return f"Maze<width: {self.width}, height: {self.height}, seed: {self.seed}>"
+
+
+def generate(width: int, height: int, seed: int, ruleset: Optional[Union[Ruleset, TemplateTileManager]] = None,
+             *, big_rooms: bool = True) -> Maze:
+    """
+    Generate and finish a maze without a display or frame clock
+
+    :param width: Width of the maze in tiles
+    :param height: Height of the maze in tiles
+    :param seed: Seed for the random number generator
+    :param ruleset: The template tiles to generate with, defaults to the predefined ruleset
+    :param big_rooms: Whether to place the four big room entrances before collapsing
+    """
+
+    if ruleset is None:
+        ruleset = load_default_ruleset()
+
+    wfc = WaveFunctionCollapse(ruleset, width=width, height=height, rng=random.Random(seed))
+
+    if big_rooms:
+        place_big_room_entrances(wfc)
+
+    wfc.run()
+    maze_finisher = MazeFinisher(wfc)
+    maze_finisher.run()
+
+    return Maze.from_wfc(wfc, seed, maze_finisher.seen)
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from Config import Config
+from Generator.Batch import Job, generate_batch
+from Generator.MazeFile import MazeWriter
+from Generator.Partition import generate_partitioned
+from Rasterizer import Rasterizer, save_png
+
+
+def generate_strips(jobs: list[Job], strips: int, workers: int):
+    for job in jobs:
+        maze, report = generate_partitioned(job.width, job.height, job.seed, strips=strips, workers=workers,
+                                            big_rooms=job.big_rooms)
+        print(report, file=sys.stderr)
+        yield maze
+
+
+def save_images(mazes, directory: str, tile_size: int):
+    """
+    Save a PNG of every maze into the directory while passing the mazes on
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    rasterizer = None
+
+    for maze in mazes:
+        if rasterizer is None or rasterizer.ruleset is not maze.ruleset:
+            rasterizer = Rasterizer(maze.ruleset, tile_size, tile_size)
+
+        save_png(rasterizer.rasterize_maze(maze), os.path.join(directory, f"maze-{maze.seed}.png"))
+        yield maze
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m Generator",
+        description="Generate finished mazes without opening a window"
+    )
+    parser.add_argument("--width", type=int, default=Config.SW // Config.CW)
+    parser.add_argument("--height", type=int, default=Config.SH // Config.CH)
+    parser.add_argument("--seed", type=int, default=Config.SEED, help="Seed of the first maze")
+    parser.add_argument("--count", type=int, default=1, help="Amount of mazes, seeded seed, seed + 1, ...")
+    parser.add_argument("--workers", type=int, default=1, help="Amount of worker processes, 0 for one per core")
+    parser.add_argument("--strips", type=int, default=None,
+                        help="Split every maze into strips that the workers solve in parallel, for single big mazes")
+    parser.add_argument("--no-big-rooms", action="store_true", help="Don't place the big room entrances")
+    parser.add_argument("--format", choices=["jsonl", "binary"], default="jsonl",
+                        help="JSON lines, or the compact binary format of Generator.MazeFile")
+    parser.add_argument("--png", metavar="DIRECTORY", help="Also save an image of every maze into the directory")
+    parser.add_argument("--tile-size", type=int, default=Config.CW, help="Size of a tile in the images in pixels")
+    parser.add_argument("-o", "--output", default="-", help="File to write to, '-' for stdout")
+    args = parser.parse_args()
+
+    jobs = [
+        Job(args.width, args.height, seed, big_rooms=not args.no_big_rooms)
+        for seed in range(args.seed, args.seed + args.count)
+    ]
+
+    binary = args.format == "binary"
+
+    if args.output == "-":
+        output = sys.stdout.buffer if binary else sys.stdout
+    else:
+        output = open(args.output, "wb" if binary else "w")
+
+    start = time.perf_counter()
+
+    try:
+        if args.strips is None:
+            mazes = (maze for _, maze in generate_batch(jobs, workers=args.workers or None, ordered=True))
+        else:
+            mazes = generate_strips(jobs, args.strips, args.workers or None)
+
+        if args.png is not None:
+            mazes = save_images(mazes, args.png, args.tile_size)
+
+        if binary:
+            with MazeWriter(output) as writer:
+                for maze in mazes:
+                    writer.write(maze)
+        else:
+            for maze in mazes:
+                output.write(json.dumps(maze.to_dict()) + "\n")
+    finally:
+        if output not in (sys.stdout, sys.stdout.buffer):
+            output.close()
+
+    print(f"Generated {args.count} maze(s) in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
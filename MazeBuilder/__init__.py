@@ -1,7 +1,7 @@
 import numpy as numpy
 
 from Direction import Direction
-from TemplateTile import TemplateTileManager, TileType, TemplateTile
+from TemplateTile import TemplateTileManager, TileType, TemplateTile, WITH_CONNECTION, WITHOUT_CONNECTION
 
 
 class MazeTile:
@@ -17,35 +17,40 @@ class MazeBuilder:
     def construct(self):
         maze_tile_types = TileType.get_rotated_maze_tiles()
 
-        for maze_tile_type, obj in maze_tile_types.items():
+        # (TileType, rotation) tuples each registered special tile accepts per direction
+        special_connections = [
+            (special_tile, {
+                direction: {(tile_type, rotation) for tile_type, rotation in connectable_tiles}
+                for direction, connectable_tiles in special_tile.connectable_tiles.items()
+            })
+            for special_tile in self.registered_tiles
+        ]
+
+        for (tile_type, rotation), obj in maze_tile_types.items():
             connectable_tiles = {Direction.UP: [], Direction.RIGHT: [], Direction.DOWN: [], Direction.LEFT: []}
-            rotation = int(maze_tile_type.split("_")[-1])
             connections = obj["connections"]
             allowed_corners = obj["allowed_corners"]
 
             for direction in Direction:
                 opposite_direction = direction.get_opposite()
 
-                for neighbor_tile_type, neighbor_obj in maze_tile_types.items():
-                    neighbor_rotation = int(neighbor_tile_type.split("_")[-1])
-                    neighbor_connections = neighbor_obj["connections"]
+                # Both tiles have to either connect to or turn away from each other
+                if connections[direction.value]:
+                    neighbors = WITH_CONNECTION[opposite_direction]
+                else:
+                    neighbors = WITHOUT_CONNECTION[opposite_direction]
 
-                    if connections[direction.value] and neighbor_connections[opposite_direction.value]:
-                        connectable_tiles[direction].append(
-                            [TileType.get_from_identifier(neighbor_tile_type), neighbor_rotation])
-                    elif not connections[direction.value] and not neighbor_connections[opposite_direction.value]:
-                        connectable_tiles[direction].append(
-                            [TileType.get_from_identifier(neighbor_tile_type), neighbor_rotation])
+                connectable_tiles[direction].extend(
+                    [neighbor_tile_type, neighbor_rotation] for neighbor_tile_type, neighbor_rotation in neighbors)
 
-            for special_tile in self.registered_tiles:
+            for special_tile, accepted_tiles in special_connections:
                 for direction in Direction:
-                    if [TileType.get_from_identifier(maze_tile_type), rotation] in special_tile.connectable_tiles[
-                        direction.get_opposite()]:
+                    if (tile_type, rotation) in accepted_tiles[direction.get_opposite()]:
                         connectable_tiles[direction].append([special_tile.tile_type, special_tile.rotation])
 
             self.template_tile_manager.add_tile(
                 TemplateTile(
-                    TileType.get_from_identifier(maze_tile_type),
+                    tile_type,
                     connectable_tiles,
                     rotation=rotation,
                     allowed_corners=allowed_corners
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import typing
+from typing import Iterable, Optional
+
+import numpy
+
+if typing.TYPE_CHECKING:
+    from WFC import WaveFunctionCollapse
+
+
+class ConnectivityReport:
+    def __init__(self, components_before: int, components_after: int, connections: int):
+        """
+        :param components_before: Amount of groups of connected maze tiles before finishing
+        :param components_after: Amount of groups left, more than one if some maze tiles are walled in by rooms
+        :param connections: Amount of connections that were opened up to join the groups
+        """
+
+        self.components_before = components_before
+        self.components_after = components_after
+        self.connections = connections
+
+    def __repr__(self):
+        return (f"ConnectivityReport<components before: {self.components_before}, "
+                f"components after: {self.components_after}, connections: {self.connections}>")
+
+
+class DisjointSet:
+    def __init__(self, size: int):
+        self.parents: list[int] = list(range(size))
+
+    def find(self, item: int) -> int:
+        parents = self.parents
+
+        while parents[item] != item:
+            # Path halving, every other item on the way points to its grandparent afterwards
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+
+        return item
+
+    def union(self, first: int, second: int) -> bool:
+        """
+        :return: Whether the items were in different sets before
+        """
+
+        first, second = self.find(first), self.find(second)
+
+        if first == second:
+            return False
+
+        self.parents[first] = second
+        return True
+
+
+class ConnectivityFinisher:
+    """
+    Alternative to MazeFinisher that joins the maze in two linear passes instead of walking it. A disjoint set of the
+    maze tiles is built from their connections, then walls between different groups are opened up in random order,
+    only where they join two groups, which is a random spanning tree over the groups and the fewest connections
+    possible
+    """
+
+    def __init__(self, wfc: WaveFunctionCollapse, fixed: Optional[numpy.ndarray] = None, *,
+                 excluded: Optional[numpy.ndarray] = None, links: Iterable[tuple[int, int]] = ()):
+        """
+        :param fixed: Tiles to keep as they are if possible, indexed like the tiles. Walls next to them are only opened
+            up once no other wall can join the groups anymore, walls between two of them last
+        :param excluded: Tiles to leave out as if they were not maze tiles, indexed like the tiles
+        :param links: Pairs of tile indices that are connected without going through the grid, e.g. through the rest
+            of a bigger grid the solver is a part of
+        """
+
+        self.wfc: WaveFunctionCollapse = wfc
+        self.fixed = fixed
+        self.excluded = excluded
+        self.links = list(links)
+        self.is_finished = False
+        self.report: Optional[ConnectivityReport] = None
+
+    def get_masks(self) -> numpy.ndarray:
+        """
+        :return: Connection mask of every tile indexed by [y, x], -1 for the tiles that are not maze tiles
+        """
+
+        masks = numpy.array([-1 if mask is None else mask for mask in self.wfc.ruleset.connection_masks])
+        masks = masks[self.wfc.templates]
+
+        if self.excluded is not None:
+            masks[self.excluded] = -1
+
+        return masks.reshape(self.wfc.height, self.wfc.width)
+
+    def get_neighbor_pairs(self, masks: numpy.ndarray) -> tuple[numpy.ndarray, ...]:
+        """
+        :return: (tile indices, neighbor indices, direction.value from the tile to the neighbor, whether they are
+            connected) of every pair of neighboring maze tiles, only looking right and down
+        """
+
+        indices = numpy.arange(self.wfc.size).reshape(masks.shape)
+        maze = masks >= 0
+        tiles, neighbors, directions, connected = [], [], [], []
+
+        for direction, tile, neighbor in (
+            (1, numpy.s_[:, :-1], numpy.s_[:, 1:]),
+            (2, numpy.s_[:-1, :], numpy.s_[1:, :])
+        ):
+            pairs = maze[tile] & maze[neighbor]
+            tiles.append(indices[tile][pairs])
+            neighbors.append(indices[neighbor][pairs])
+            directions.append(numpy.full(numpy.count_nonzero(pairs), direction))
+            connected.append(
+                (masks[tile][pairs] >> direction & 1 != 0) & (masks[neighbor][pairs] >> (direction + 2) % 4 & 1 != 0))
+
+        return numpy.concatenate(tiles), numpy.concatenate(neighbors), numpy.concatenate(directions), \
+            numpy.concatenate(connected)
+
+    def join_connected(self) -> tuple[DisjointSet, int, tuple[numpy.ndarray, ...], numpy.ndarray]:
+        """
+        :return: (disjoint set of the tiles joined by their connections, amount of groups of maze tiles, neighbor
+            pairs from get_neighbor_pairs, maze tiles indexed by [y, x])
+        """
+
+        masks = self.get_masks()
+        pairs = tiles, neighbors, _, connected = self.get_neighbor_pairs(masks)
+
+        disjoint_set = DisjointSet(self.wfc.size)
+        components = int(numpy.count_nonzero(masks >= 0))
+
+        for tile, neighbor in zip(tiles[connected].tolist(), neighbors[connected].tolist()):
+            if disjoint_set.union(tile, neighbor):
+                components -= 1
+
+        maze = (masks >= 0).ravel()
+
+        for tile, neighbor in self.links:
+            if maze[tile] and maze[neighbor] and disjoint_set.union(tile, neighbor):
+                components -= 1
+
+        return disjoint_set, components, pairs, masks >= 0
+
+    def finish(self) -> ConnectivityReport:
+        disjoint_set, components, (tiles, neighbors, directions, connected), _ = self.join_connected()
+        components_before = components
+
+        # Walls between groups in a random order drawn from the solver, so the same seed opens up the same walls
+        walls = ~connected
+        order = numpy.random.default_rng(self.wfc.rng.getrandbits(64)).permutation(numpy.count_nonzero(walls))
+
+        if self.fixed is not None:
+            fixed = self.fixed.astype(numpy.uint8)
+            order = order[numpy.argsort((fixed[tiles] + fixed[neighbors])[walls][order], kind="stable")]
+
+        added = numpy.zeros(self.wfc.size, dtype=numpy.uint8)
+
+        for tile, neighbor, direction in zip(tiles[walls][order].tolist(), neighbors[walls][order].tolist(),
+                                             directions[walls][order].tolist()):
+            if components == 1:
+                break
+
+            if not disjoint_set.union(tile, neighbor):
+                continue
+
+            components -= 1
+            added[tile] |= 1 << direction
+            added[neighbor] |= 1 << (direction + 2) % 4
+
+        self.wfc.add_connections(added)
+
+        self.report = ConnectivityReport(components_before, components, components_before - components)
+        self.is_finished = True
+
+        return self.report
+
+    def get_components(self) -> tuple[numpy.ndarray, int]:
+        """
+        :return: (label of the group of every maze tile indexed like the tiles, -1 for the other tiles, amount of
+            groups). The maze is fully connected once there is a single group
+        """
+
+        disjoint_set, components, _, maze = self.join_connected()
+        maze = maze.ravel()
+
+        roots = numpy.array([disjoint_set.find(tile) for tile in range(self.wfc.size)])
+        labels = numpy.full(self.wfc.size, -1)
+        labels[maze] = numpy.unique(roots[maze], return_inverse=True)[1]
+
+        return labels, components
+
+    def run(self):
+        self.finish()
@@ -1,78 +1,290 @@
 from __future__ import annotations
 
-import collections
-import random
+import time
 import typing
+from typing import Optional
 
-import pygame
+import numpy
 
 from Config import Config
-from Direction import Direction
-from TemplateTile import TileType
+from Scheduler import StepScheduler
+from Stats import Stats
+from WFC import get_view
 
 if typing.TYPE_CHECKING:
+    import pygame
+
     from WFC import WaveFunctionCollapse
     from Tile import Tile
 
+# Color the tiles on the path of the finisher are drawn with
+PATH_COLOR = (20, 20, 20)
+# The directions in every 4 bit direction mask, in the order the walk picks from them
+MASK_DIRECTIONS = [tuple(direction for direction in range(4) if mask >> direction & 1) for mask in range(16)]
+
 
 class MazeFinisher:
+    """
+    Walks the collapsed maze depth first from its first maze tile in reading order and connects every maze tile it
+    can't reach to the tile it came from, so every maze tile ends up reachable
+    """
+
     def __init__(self, wfc: WaveFunctionCollapse):
         self.wfc: WaveFunctionCollapse = wfc
-        self.current_tile: Tile = self.wfc.get_tile_at(0, 0)
-        self.visited_tiles: list[Tile] = [self.current_tile]
-        self.backtracking_tiles: list[Tile] = []
+        # Indices of the tiles from the first tile to the current one, the current tile is the last. Empty until the
+        # walk started, as the first maze tile is only known once the solver is done
+        self.path: list[int] = []
+        # Whether every tile was walked to already, indexed like the tiles of the solver
+        self.seen: numpy.ndarray = numpy.zeros(wfc.size, dtype=numpy.bool_)
+        # Whether every tile is on the path, which is what is drawn
+        self.on_path: numpy.ndarray = numpy.zeros(wfc.size, dtype=numpy.bool_)
+        self.is_started = False
+        self.is_finished = False
+        # How often the walk went back a tile and how many pairs of tiles it connected
+        self.backtracks = 0
+        self.connections = 0
+        # Indices of the tiles that were added to or removed from the path since they were last drawn, only tracked
+        # once a renderer asks for it by setting it to a set
+        self.changed_tiles: Optional[set[int]] = None
+
+        self._seen = memoryview(self.seen)
+        self._on_path = memoryview(self.on_path)
+        self._templates = get_view(wfc.templates)
+
+        self.scheduler = StepScheduler(self.update, lambda: self.is_finished)
+        # Times the steps once attached, see Stats
+        self.stats: Optional[Stats] = None
+
+    @property
+    def current_tile(self) -> Tile:
+        return self.wfc.get_tile(self.path[-1])
+
+    @property
+    def visited_tiles(self) -> list[Tile]:
+        return [self.wfc.get_tile(index) for index in self.path]
 
     def update(self):
-        neighbors: dict[Direction, Tile] = {
-            k: v for k, v in self.wfc.get_neighbors(self.current_tile).items() if
-            v is not None and v not in self.visited_tiles and v not in self.backtracking_tiles
-        }
+        if self.is_finished:
+            return
 
-        items = neighbors.items()
-        random.shuffle(list(items))
+        if self.stats is None:
+            self.walk()
+            return
 
-        for direction, neighbor in items:
-            not_rot_connections = TileType.get_connections(neighbor.template_tile.tile_type)
+        start = time.perf_counter()
+        self.walk()
+        self.stats.add_time("walk", start)
+        self.stats.step()
 
-            # The neighbor is not a maze tile (CANNOT NAVIGATE TO IT)
-            if not_rot_connections is None:
-                continue
+    def start(self):
+        """
+        Put the first maze tile on the path, the top left tile can be a room which the walk must not connect from
+        """
+
+        masks = self.wfc.ruleset.connection_masks
+        self.is_started = True
+        index = next((index for index, template_id in enumerate(self._templates) if masks[template_id] is not None),
+                     None)
+
+        if index is None:
+            self.is_finished = True
+            return
+
+        self._seen[index] = True
+        self._on_path[index] = True
+        self.path.append(index)
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.add(index)
+
+    def walk(self):
+        """
+        Walk a single tile further, or back if there is nowhere left to go
+        """
 
-            rotated_connections = collections.deque(not_rot_connections)
-            rotated_connections.rotate(neighbor.template_tile.rotation)
-
-            # Check if the neighbor can connect to the current tile
-            if rotated_connections[direction.get_opposite().value]:
-                self.current_tile = neighbor
-                self.visited_tiles.append(neighbor)
-                break
-        else:
-            # If there is no neighbor to connect to
-            maze_tiles = {k: t for k, t in neighbors.items() if
-                          TileType.get_connections(t.template_tile.tile_type) is not None}
-
-            if len(maze_tiles) == 0:
-                self.backtrack()
+        if not self.is_started:
+            self.start()
+
+            if self.is_finished:
                 return
 
-            random_tile = random.choice(list(maze_tiles.items()))
+        masks, templates, seen = self.wfc.ruleset.connection_masks, self._templates, self._seen
+        current = self.path[-1]
 
-            # Connect the two tiles to the algorithm can continue
-            self.wfc.connect_tiles(self.current_tile, random_tile[1], random_tile[0])
-            self.current_tile = random_tile[1]
-            self.visited_tiles.append(self.current_tile)
+        # Unvisited maze tiles next to the current tile, split by whether they connect back to it
+        connected, unconnected = [], []
 
-    def backtrack(self):
-        if len(self.visited_tiles) == 0:
+        for direction, neighbor in self.wfc.get_neighbor_indices(current):
+            mask = masks[templates[neighbor]]
+
+            if seen[neighbor] or mask is None:
+                continue
+
+            if mask >> (direction + 2) % 4 & 1:
+                connected.append((direction, neighbor))
+            else:
+                unconnected.append((direction, neighbor))
+
+        neighbors = connected or unconnected
+
+        if not neighbors:
+            self.backtrack()
             return
 
-        self.backtracking_tiles.append(self.current_tile)
-        self.current_tile = self.visited_tiles.pop()
+        # Walk to a random neighbor that connects to the current tile, if none does connect a random one to it
+        direction, neighbor = neighbors[int(self.wfc.rng.random() * len(neighbors))]
+
+        if not connected:
+            if self.stats is None:
+                self.wfc.connect(current, neighbor, direction)
+            else:
+                start = time.perf_counter()
+                self.wfc.connect(current, neighbor, direction)
+                self.stats.add_time("connect", start)
+
+            self.connections += 1
+
+        seen[neighbor] = True
+        self._on_path[neighbor] = True
+        self.path.append(neighbor)
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.add(neighbor)
+
+    def backtrack(self):
+        index = self.path.pop()
+        self._on_path[index] = False
+        self.backtracks += 1
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.add(index)
+
+        if not self.path:
+            self.is_finished = True
+
+    def finish(self):
+        """
+        Walk and connect the rest of the maze in one go, does the same as calling update until the maze is finished
+        """
+
+        start = time.perf_counter()
+        wfc = self.wfc
+
+        if not self.is_started:
+            self.start()
+
+        width, height = wfc.width, wfc.height
+        # The walk runs on a grid with a border of tiles that can't be walked to, so neighbors need no bounds checks
+        padded_width = width + 2
+
+        def get_tiles(grid: bytearray) -> numpy.ndarray:
+            return numpy.frombuffer(grid, dtype=numpy.uint8).reshape(height + 2, padded_width)[1:-1, 1:-1]
+
+        masks = numpy.array([-1 if mask is None else mask for mask in wfc.ruleset.connection_masks])
+        padded = numpy.full((height + 2, padded_width), -1)
+        padded[1:-1, 1:-1] = masks[wfc.templates].reshape(height, width)
+        padded[1:-1, 1:-1][self.seen.reshape(height, width)] = -1
+
+        # The directions in which the neighbor of every tile is a maze tile that connects back to it. The connections
+        # are only read before a tile is walked to, so the ones opened up by the walk are added all at once at the end
+        maze = padded >= 0
+        back = numpy.zeros(padded.shape, dtype=numpy.int64)
+        back[1:, :] |= maze[:-1, :] & (padded[:-1, :] & 4 != 0)
+        back[:, :-1] |= (maze[:, 1:] & (padded[:, 1:] & 8 != 0)) << 1
+        back[:-1, :] |= (maze[1:, :] & (padded[1:, :] & 1 != 0)) << 2
+        back[:, 1:] |= (maze[:, :-1] & (padded[:, :-1] & 2 != 0)) << 3
+        back = back.astype(numpy.uint8).tobytes()
+
+        # Every bit set for maze tiles that were not walked to yet, so it can be masked with the direction to them
+        walkable = bytearray((maze * 15).astype(numpy.uint8).tobytes())
+        unwalked = get_tiles(walkable) != 0
+
+        added = bytearray(len(walkable))
+        random = wfc.rng.random
+        offsets = (-padded_width, 1, padded_width, -1)
+        # The offsets to the neighbors in every direction mask and how many there are, to pick one of them
+        choices = [tuple(offsets[direction] for direction in directions) for directions in MASK_DIRECTIONS]
+        counts = [len(directions) for directions in MASK_DIRECTIONS]
+        # offset -> (connection of a tile to the neighbor at the offset, connection of the neighbor back to it)
+        sides = {offsets[direction]: (1 << direction, 1 << (direction + 2) % 4) for direction in range(4)}
+        path = [index + index // width * 2 + padded_width + 1 for index in self.path]
+        append, pop = path.append, path.pop
+        current = path[-1] if path else 0
+
+        while path:
+            # Same neighbors in the same order as update
+            free = walkable[current - padded_width] & 1 | walkable[current + 1] & 2 | \
+                walkable[current + padded_width] & 4 | walkable[current - 1] & 8
+
+            if not free:
+                pop()
+
+                if path:
+                    current = path[-1]
+
+                continue
+
+            connected = free & back[current]
+            options = connected or free
+            neighbor = current + choices[options][int(random() * counts[options])]
+
+            if not connected:
+                to_neighbor, to_current = sides[neighbor - current]
+                added[current] |= to_neighbor
+                added[neighbor] |= to_current
+
+            walkable[neighbor] = 0
+
+            # With a single neighbor left the tile has nowhere to go once the walk comes back, so it is left right away
+            if free & (free - 1):
+                append(neighbor)
+            else:
+                path[-1] = neighbor
+
+            current = neighbor
+
+        # Every maze tile that is no longer walkable was walked to, and every tile on the path was walked back from
+        walked = unwalked & (get_tiles(walkable) == 0)
+        self.seen |= walked.ravel()
+        self.backtracks += len(self.path) + int(numpy.count_nonzero(walked))
+        # Every opened connection sets a bit on both of its tiles
+        self.connections += int(numpy.unpackbits(numpy.frombuffer(added, dtype=numpy.uint8)).sum()) // 2
+
+        if self.stats is not None:
+            self.stats.add_time("walk", start)
+            start = time.perf_counter()
+
+        wfc.add_connections(get_tiles(added).ravel())
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.update(self.path)
+
+        self.path.clear()
+        self.on_path[:] = False
+        self.is_finished = True
+
+        if self.stats is not None:
+            self.stats.add_time("connect", start)
+            self.stats.step()
+
+    def run(self):
+        self.finish()
+
+    def run_for(self, budget_ms: float) -> int:
+        """
+        Do as many updates as fit in the time budget, e.g. the time left in a frame
+
+        :return: The amount of updates done
+        """
+
+        return self.scheduler.run_for(budget_ms)
 
     def draw(self, screen: pygame.Surface):
-        for visited_tile in self.visited_tiles:
+        import pygame
+
+        for index in self.path:
             pygame.draw.rect(
                 screen,
-                (20, 20, 20),
-                (visited_tile.x * Config.CW, visited_tile.y * Config.CH, Config.CW, Config.CH)
+                PATH_COLOR,
+                (index % self.wfc.width * Config.CW, index // self.wfc.width * Config.CH, Config.CW, Config.CH)
             )
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import os
+import typing
+from typing import Sequence, Union
+
+import numpy
+
+from Config import Config
+from TemplateTile import Ruleset
+from Tile.Shapes import BACKGROUND_COLOR, SHAPE_PADDING, Color, get_shape
+
+if typing.TYPE_CHECKING:
+    from Generator import Maze
+
+
+class Rasterizer:
+    """
+    Turns grids of template ids into RGB images without a display, looking up a bitmap per template instead of drawing
+    tile by tile. The image is pixel for pixel what the window shows for the same grid, including the shapes that
+    stick out of their tile into the neighbor drawn before or after it
+    """
+
+    def __init__(self, ruleset: Ruleset, cw: int = Config.CW, ch: int = Config.CH,
+                 background: Color = BACKGROUND_COLOR):
+        """
+        :param cw: Width of a tile in pixels, smaller than Config.CW for thumbnails
+        :param ch: Height of a tile in pixels
+        """
+
+        self.ruleset = ruleset
+        self.cw, self.ch = cw, ch
+
+        p = SHAPE_PADDING
+        # An extra template that draws nothing, standing in for the tiles outside the grid
+        self.blank = len(ruleset)
+
+        # Which pixels of the padded sprite every template draws, and with which color
+        masks = numpy.zeros((len(ruleset) + 1, ch + p * 2, cw + p * 2), dtype=numpy.bool_)
+        self.colors = numpy.zeros((len(ruleset) + 1, 3), dtype=numpy.uint8)
+
+        for template_id, template_tile in enumerate(ruleset.tiles):
+            rects, color = get_shape(template_tile.tile_type, template_tile.rotation, cw, ch)
+            self.colors[template_id] = color
+
+            for x, y, width, height in rects:
+                masks[template_id, max(y + p, 0):y + p + height, max(x + p, 0):x + p + width] = True
+
+        self.core_masks = masks[:, p:p + ch, p:p + cw]
+        self.cores = numpy.where(self.core_masks[..., None], self.colors[:, None, None], numpy.uint8(background))
+
+        # The parts of the sprites that stick out into a neighbor, in the order the window draws them: the neighbors
+        # above and to the left are drawn before the tile, the others after it
+        self.overhangs = []
+
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if dx == dy == 0:
+                    continue
+
+                # The neighbor at (dy, dx) draws the pixels tile_rows x tile_columns of the tile with the pixels
+                # sprite_rows x sprite_columns of its sprite
+                tile_rows, sprite_rows = self.get_overhang_slices(dy, ch)
+                tile_columns, sprite_columns = self.get_overhang_slices(dx, cw)
+                overhang = masks[:, sprite_rows, sprite_columns]
+
+                if overhang.any():
+                    self.overhangs.append((dy, dx, tile_rows, tile_columns, overhang))
+
+    @staticmethod
+    def get_overhang_slices(offset: int, size: int) -> tuple[slice, slice]:
+        p = SHAPE_PADDING
+
+        if offset < 0:
+            return slice(0, p), slice(size + p, size + p * 2)
+        if offset > 0:
+            return slice(size - p, size), slice(0, p)
+
+        return slice(0, size), slice(p, p + size)
+
+    def rasterize(self, template_ids: Union[numpy.ndarray, Sequence[int]], width: int, height: int) -> numpy.ndarray:
+        """
+        :param template_ids: The template id of every tile, indexed by x + y * width
+        :return: uint8 RGB image of shape (height * ch, width * cw, 3)
+        """
+
+        ids = numpy.asarray(template_ids, dtype=numpy.intp).reshape(height, width)
+
+        padded_ids = numpy.full((height + 2, width + 2), self.blank, dtype=numpy.intp)
+        padded_ids[1:-1, 1:-1] = ids
+
+        # (height, width, ch, cw, 3), every tile by itself
+        image = self.cores[ids]
+
+        for dy, dx, tile_rows, tile_columns, overhang in self.overhangs:
+            neighbor_ids = padded_ids[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+            drawn = overhang[neighbor_ids]
+
+            # Neighbors drawn before the tile only show where the tile itself draws nothing
+            if (dy, dx) < (0, 0):
+                drawn &= ~self.core_masks[ids][:, :, tile_rows, tile_columns]
+
+            numpy.copyto(image[:, :, tile_rows, tile_columns], self.colors[neighbor_ids][:, :, None, None],
+                         where=drawn[..., None])
+
+        return image.transpose(0, 2, 1, 3, 4).reshape(height * self.ch, width * self.cw, 3)
+
+    def rasterize_maze(self, maze: Maze) -> numpy.ndarray:
+        return self.rasterize(maze.template_ids, maze.width, maze.height)
+
+
+def save_png(image: numpy.ndarray, path: str):
+    """
+    Save an RGB image of shape (height, width, 3) as a PNG, no display needed
+    """
+
+    # Only needed for the PNG encoder, and its greeting would end up in the output of the headless generator
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+
+    image = numpy.ascontiguousarray(image, dtype=numpy.uint8)
+    pygame.image.save(pygame.image.frombuffer(image, (image.shape[1], image.shape[0]), "RGB"), path)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+import pygame
+
+from Config import Config
+from MazeFinisher import PATH_COLOR, MazeFinisher
+from Tile.Shapes import BACKGROUND_COLOR, SHAPE_PADDING
+from WFC import WaveFunctionCollapse
+
+
+class Renderer:
+    """
+    Draws a solver and its finisher, only redrawing the tiles that changed since the last frame. The path of the
+    finisher is drawn once the solver is finished
+    """
+
+    def __init__(self, screen: pygame.Surface, wfc: WaveFunctionCollapse,
+                 maze_finisher: Optional[MazeFinisher] = None, *, max_changed_ratio: float = 0.25):
+        """
+        :param max_changed_ratio: Share of the tiles that may change in one frame before the whole screen is drawn
+            again instead
+        """
+
+        self.screen = screen
+        self.wfc = wfc
+        self.maze_finisher = maze_finisher
+        self.max_changed_ratio = max_changed_ratio
+
+        self.is_drawn = False
+        self.draws_path = False
+
+        wfc.changed_tiles = set()
+
+        if maze_finisher is not None:
+            maze_finisher.changed_tiles = set()
+
+    def get_changed_tiles(self) -> set[int]:
+        changed = self.wfc.changed_tiles
+        self.wfc.changed_tiles = set()
+
+        if self.maze_finisher is not None:
+            changed |= self.maze_finisher.changed_tiles
+            self.maze_finisher.changed_tiles = set()
+
+        return changed
+
+    def draw(self) -> list[pygame.Rect]:
+        """
+        Draw everything that changed since the last call
+
+        :return: The parts of the screen that were drawn, to pass on to pygame.display.update
+        """
+
+        if self.wfc.stats is None:
+            return self.draw_changed()
+
+        start = time.perf_counter()
+
+        try:
+            return self.draw_changed()
+        finally:
+            self.wfc.stats.add_time("draw", start)
+
+    def draw_changed(self) -> list[pygame.Rect]:
+        changed = self.get_changed_tiles()
+        draws_path = self.maze_finisher is not None and self.wfc.is_finished
+
+        if not self.is_drawn or draws_path != self.draws_path or \
+                len(changed) > self.wfc.size * self.max_changed_ratio:
+            self.draws_path = draws_path
+            return [self.draw_all()]
+
+        return [self.draw_tile(index) for index in sorted(changed)]
+
+    def draw_all(self) -> pygame.Rect:
+        self.screen.fill(BACKGROUND_COLOR)
+
+        if self.draws_path:
+            self.maze_finisher.draw(self.screen)
+
+        self.wfc.draw(self.screen)
+        self.is_drawn = True
+
+        return self.screen.get_rect()
+
+    def draw_tile(self, index: int) -> pygame.Rect:
+        """
+        Draw a tile again, together with the parts of its neighbors that reach into it, in the same order as draw_all
+        """
+
+        wfc = self.wfc
+        x, y = index % wfc.width, index // wfc.width
+        area = pygame.Rect(x * Config.CW - SHAPE_PADDING, y * Config.CH - SHAPE_PADDING,
+                           Config.CW + SHAPE_PADDING * 2, Config.CH + SHAPE_PADDING * 2)
+
+        neighbors = [
+            (nx, ny)
+            for ny in range(max(y - 1, 0), min(y + 2, wfc.height))
+            for nx in range(max(x - 1, 0), min(x + 2, wfc.width))
+        ]
+
+        self.screen.set_clip(area)
+        self.screen.fill(BACKGROUND_COLOR, area)
+
+        if self.draws_path:
+            for nx, ny in neighbors:
+                if self.maze_finisher.on_path[nx + ny * wfc.width]:
+                    self.screen.fill(PATH_COLOR, (nx * Config.CW, ny * Config.CH, Config.CW, Config.CH))
+
+        sprites = wfc.get_sprites()
+
+        for nx, ny in neighbors:
+            sprite = sprites[wfc.templates[nx + ny * wfc.width]]
+
+            if sprite is not None:
+                self.screen.blit(sprite, (nx * Config.CW - SHAPE_PADDING, ny * Config.CH - SHAPE_PADDING))
+
+        self.screen.set_clip(None)
+        return area.clip(self.screen.get_rect())
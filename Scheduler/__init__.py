@@ -0,0 +1,64 @@
+import time
+from typing import Callable, Optional
+
+
+class StepScheduler:
+    """
+    Runs a step function for as long as a time budget allows. How long a step takes is learned along the way, so the
+    clock is only read once per batch of steps instead of after every step
+    """
+
+    def __init__(self, step: Callable[[], None], is_done: Callable[[], bool], *, smoothing: float = 0.2):
+        """
+        :param step: Does a single step
+        :param is_done: Whether there is nothing left to step
+        :param smoothing: How much the latest measurement weighs into the estimated cost of a step
+        """
+
+        self.step = step
+        self.is_done = is_done
+        self.smoothing = smoothing
+
+        # Estimated seconds per step, None until the first step was measured
+        self.step_seconds: Optional[float] = None
+        self.steps = 0
+
+    def run_for(self, budget_ms: float) -> int:
+        """
+        Step until the budget is used up or there is nothing left to step. At least one step is done
+
+        :return: The amount of steps done
+        """
+
+        now = time.perf_counter()
+        deadline = now + budget_ms / 1000
+        steps = 0
+
+        while not self.is_done():
+            if self.step_seconds is None or self.step_seconds <= 0:
+                batch = 1
+            else:
+                # Only plan half of the time that is left, the rest is planned again with a better estimate
+                batch = max(1, int((deadline - now) / self.step_seconds / 2))
+
+            done = 0
+
+            while done < batch and not self.is_done():
+                self.step()
+                done += 1
+
+            elapsed = time.perf_counter() - now
+            now += elapsed
+            steps += done
+
+            step_seconds = elapsed / done
+            if self.step_seconds is None:
+                self.step_seconds = step_seconds
+            else:
+                self.step_seconds += (step_seconds - self.step_seconds) * self.smoothing
+
+            if now >= deadline:
+                break
+
+        self.steps += steps
+        return steps
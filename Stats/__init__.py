@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import collections
+import time
+import typing
+from typing import Callable, Optional
+
+if typing.TYPE_CHECKING:
+    from MazeFinisher import MazeFinisher
+    from WFC import WaveFunctionCollapse
+
+
+class Stats:
+    """
+    Counters and the time spent per phase of a solver, its finisher and whatever draws them. The counters are kept
+    by the solver and finisher either way, timing only happens while a Stats object is attached to them
+
+    Phases: select (picking the tile with the lowest entropy), collapse (picking its template tile, including the
+    propagation), propagate (removing unsupported template tiles from the neighbors), walk (the finisher walking the
+    maze), connect (opening up connections between tiles, part of walk while the finisher steps tile by tile) and draw
+    """
+
+    def __init__(self, wfc: WaveFunctionCollapse, maze_finisher: Optional[MazeFinisher] = None, *,
+                 on_step: Optional[Callable[['Stats'], None]] = None):
+        """
+        :param on_step: Called after every step of the solver or finisher, and after the finisher finished in one go
+        """
+
+        self.wfc = wfc
+        self.maze_finisher = maze_finisher
+        self.on_step = on_step
+
+        # phase -> seconds spent in it
+        self.phase_seconds: collections.Counter[str] = collections.Counter()
+        self.steps = 0
+
+        wfc.stats = self
+
+        if maze_finisher is not None:
+            maze_finisher.stats = self
+
+    def detach(self):
+        self.wfc.stats = None
+
+        if self.maze_finisher is not None:
+            self.maze_finisher.stats = None
+
+    def add_time(self, phase: str, start: float):
+        """
+        :param start: time.perf_counter() when the phase started
+        """
+
+        self.phase_seconds[phase] += time.perf_counter() - start
+
+    def step(self):
+        self.steps += 1
+
+        if self.on_step is not None:
+            self.on_step(self)
+
+    @property
+    def collapses(self) -> int:
+        return self.wfc.collapses
+
+    @property
+    def propagation_visits(self) -> int:
+        return self.wfc.propagation_visits
+
+    @property
+    def domain_reductions(self) -> int:
+        return self.wfc.domain_reductions
+
+    @property
+    def contradictions(self) -> int:
+        return self.wfc.contradictions
+
+    @property
+    def recoveries(self) -> int:
+        return self.wfc.recoveries
+
+    @property
+    def finisher_backtracks(self) -> int:
+        return 0 if self.maze_finisher is None else self.maze_finisher.backtracks
+
+    @property
+    def connections(self) -> int:
+        return 0 if self.maze_finisher is None else self.maze_finisher.connections
+
+    def to_dict(self) -> dict:
+        """
+        :return: Every counter and phase time, flat for exporting to metrics
+        """
+
+        return {
+            "steps": self.steps,
+            "collapses": self.collapses,
+            "propagation_visits": self.propagation_visits,
+            "domain_reductions": self.domain_reductions,
+            "contradictions": self.contradictions,
+            "recoveries": self.recoveries,
+            "finisher_backtracks": self.finisher_backtracks,
+            "connections": self.connections,
+            **{f"{phase}_seconds": seconds for phase, seconds in self.phase_seconds.items()}
+        }
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}: {seconds:.3f}s" for phase, seconds in self.phase_seconds.most_common())
+        return f"Stats<steps: {self.steps}, collapses: {self.collapses}, contradictions: {self.contradictions}, " \
+               f"{phases}>"
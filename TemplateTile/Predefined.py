@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import typing
+from typing import Optional
+
+from Config import Config
+from Direction import Direction
+from TemplateTile import BASE_ALLOWED_CORNERS, BASE_CONNECTIONS, Ruleset, TemplateTileManager, TileType
+from TemplateTile.RulesetCache import get_definitions_hash, load_cached_ruleset
+
+if typing.TYPE_CHECKING:
+    from MazeBuilder import MazeBuilder
+    from WFC import WaveFunctionCollapse
+
+
+# Bump when the way the default ruleset is built changes, so cached rulesets are rebuilt
+RULESET_VERSION = 1
+
+
+SpecialTileDefinition = tuple[TileType, dict[Direction, list[list[TileType, int]]], list[bool], bool]
+
+
+def get_special_tile_definitions() -> list[SpecialTileDefinition]:
+    """
+    :return: (tile type, connections, allowed corners, register with the MazeBuilder) of every special tile
+    """
+
+    return [
+        (
+            TileType.SPECIAL_EMPTY,
+            {
+                Direction.UP: TileType.get_all_tiles(),
+                Direction.RIGHT: TileType.get_all_tiles(),
+                Direction.DOWN: TileType.get_all_tiles(),
+                Direction.LEFT: TileType.get_all_tiles()
+            },
+            [True, True, True, True],
+            False
+        ),
+        (
+            TileType.SPECIAL_SINGLE_ROOM,
+            {
+                Direction.UP: list(TileType.get_all_without_connection(Direction.DOWN)),
+                Direction.RIGHT: list(TileType.get_all_without_connection(Direction.LEFT)),
+                Direction.DOWN: list(TileType.get_all_without_connection(Direction.UP)),
+                Direction.LEFT: list(TileType.get_all_with_connection(Direction.RIGHT))
+            },
+            [True, True, True, False],
+            True
+        ),
+        (
+            TileType.SPECIAL_BIG_ROOM_ENTRANCE,
+            {
+                Direction.UP: [[TileType.SPECIAL_BIG_ROOM_CORNER, 0], [TileType.SPECIAL_BIG_ROOM_WALL, 0]],
+                Direction.RIGHT: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0]],
+                Direction.DOWN: [[TileType.SPECIAL_BIG_ROOM_CORNER, 3], [TileType.SPECIAL_BIG_ROOM_WALL, 0]],
+                Direction.LEFT: list(TileType.get_all_with_connection(Direction.RIGHT))
+            },
+            [False, False, False, False],
+            True
+        ),
+        (
+            TileType.SPECIAL_BIG_ROOM_MAIN,
+            {
+                Direction.UP: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0], [TileType.SPECIAL_BIG_ROOM_ENTRANCE, 1],
+                               [TileType.SPECIAL_BIG_ROOM_WALL, 1]],
+                Direction.RIGHT: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0], [TileType.SPECIAL_BIG_ROOM_ENTRANCE, 2],
+                                  [TileType.SPECIAL_BIG_ROOM_WALL, 2]],
+                Direction.DOWN: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0], [TileType.SPECIAL_BIG_ROOM_ENTRANCE, 3],
+                                 [TileType.SPECIAL_BIG_ROOM_WALL, 3]],
+                Direction.LEFT: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0], [TileType.SPECIAL_BIG_ROOM_ENTRANCE, 0],
+                                 [TileType.SPECIAL_BIG_ROOM_WALL, 0]]
+            },
+            [False, False, False, False],
+            False
+        ),
+        (
+            TileType.SPECIAL_BIG_ROOM_WALL,
+            {
+                Direction.UP: [[TileType.SPECIAL_BIG_ROOM_CORNER, 0], [TileType.SPECIAL_BIG_ROOM_WALL, 0]],
+                Direction.RIGHT: [[TileType.SPECIAL_BIG_ROOM_MAIN, 0]],
+                Direction.DOWN: [[TileType.SPECIAL_BIG_ROOM_CORNER, 3], [TileType.SPECIAL_BIG_ROOM_WALL, 0]],
+                Direction.LEFT: list(TileType.get_all_without_connection(Direction.RIGHT))
+            },
+            [False, False, False, True],
+            False
+        ),
+        (
+            TileType.SPECIAL_BIG_ROOM_CORNER,
+            {
+                Direction.UP: list(TileType.get_all_without_connection(Direction.DOWN)),
+                Direction.RIGHT: [[TileType.SPECIAL_BIG_ROOM_CORNER, 1], [TileType.SPECIAL_BIG_ROOM_WALL, 1]],
+                Direction.DOWN: [[TileType.SPECIAL_BIG_ROOM_CORNER, 3], [TileType.SPECIAL_BIG_ROOM_WALL, 0]],
+                Direction.LEFT: list(TileType.get_all_without_connection(Direction.RIGHT))
+            },
+            [True, False, False, True],
+            False
+        ),
+    ]
+
+
+def define_special_tiles(template_tile_manager: TemplateTileManager, maze_builder: MazeBuilder):
+    for tile_type, connections, allowed_corners, register in get_special_tile_definitions():
+        tiles = template_tile_manager.add_special_tile(tile_type, connections, allowed_corners=allowed_corners)
+
+        if register:
+            for tile in tiles:
+                maze_builder.register_special_tile(tile)
+
+
+def create_default_ruleset() -> Ruleset:
+    """
+    Build the template tiles used by the maze generator: the special tiles followed by every rotated maze tile
+
+    :return: The compiled Ruleset
+    """
+
+    from MazeBuilder import MazeBuilder
+
+    template_tile_manager = TemplateTileManager()
+    maze_builder = MazeBuilder(template_tile_manager)
+
+    define_special_tiles(template_tile_manager, maze_builder)
+    maze_builder.construct()
+
+    template_tile_manager.check_all_tiles_defined()
+    return template_tile_manager.compile()
+
+
+def load_default_ruleset(cache_dir: Optional[str] = Config.RULESET_CACHE_DIR) -> Ruleset:
+    """
+    Load the default ruleset from the on-disk cache, building and caching it if the tile definitions changed
+
+    :param cache_dir: Directory of the cached rulesets, None to always build the ruleset
+    """
+
+    if cache_dir is None:
+        return create_default_ruleset()
+
+    key = get_definitions_hash(
+        RULESET_VERSION,
+        get_special_tile_definitions(),
+        BASE_CONNECTIONS,
+        BASE_ALLOWED_CORNERS,
+        [(tile_type.name, tile_type.value) for tile_type in TileType]
+    )
+
+    return load_cached_ruleset(cache_dir, key, create_default_ruleset)
+
+
+def place_big_room_entrances(wfc: WaveFunctionCollapse):
+    entrance = wfc.ruleset.get_template_tile(TileType.SPECIAL_BIG_ROOM_ENTRANCE)
+
+    wfc.apply_constraints([
+        (wfc.width // 4, wfc.height // 4, entrance),
+        (wfc.width // 4 * 3, wfc.height // 4, entrance),
+        (wfc.width // 4, wfc.height // 4 * 3, entrance),
+        (wfc.width // 4 * 3, wfc.height // 4 * 3, entrance)
+    ])
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from enum import Enum
+from types import MappingProxyType
+from typing import Callable
+
+from Direction import Direction
+from TemplateTile import Ruleset, TemplateTile, TileType
+
+MAGIC = b"WFCR"
+# Bump when the layout of the file changes
+FORMAT_VERSION = 1
+
+# magic, format version, amount of tiles, bytes per mask, hash of the tile definitions
+HEADER = struct.Struct("<4sHHH32s")
+# tile type identifier, rotation, allowed corners as a 4 bit mask
+TILE = struct.Struct("<bBB")
+
+TILE_TYPES_BY_IDENTIFIER: dict[int, TileType] = {tile_type.value[0]: tile_type for tile_type in TileType}
+
+
+class RulesetCacheError(Exception):
+    pass
+
+
+def _canonical(value) -> str:
+    if isinstance(value, Enum):
+        return f"{type(value).__name__}.{value.name}{value.value!r}"
+    if isinstance(value, dict):
+        return "{" + ",".join(sorted(f"{_canonical(k)}:{_canonical(v)}" for k, v in value.items())) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_canonical(v) for v in value) + "]"
+
+    return repr(value)
+
+
+def get_definitions_hash(*definitions) -> str:
+    """
+    Hash everything a ruleset is built from, the result is used as the key of the cached ruleset
+    """
+
+    digest = hashlib.sha256(f"{MAGIC!r}{FORMAT_VERSION}".encode())
+
+    for definition in definitions:
+        digest.update(_canonical(definition).encode())
+
+    return digest.hexdigest()
+
+
+def get_ruleset_hash(ruleset: Ruleset) -> str:
+    """
+    Hash the compiled contents of a ruleset, two rulesets with the same hash assign the same ids to the same tiles
+    """
+
+    return get_definitions_hash(
+        [
+            (t.tile_type, t.rotation, list(t.allowed_corners),
+             {direction: sorted(connectable_tiles, key=_canonical)
+              for direction, connectable_tiles in t.connectable_tiles.items()})
+            for t in ruleset.tiles
+        ],
+        ruleset.allowed
+    )
+
+
+def save_ruleset(ruleset: Ruleset, path: str, key: str):
+    """
+    Write the ruleset to a compact binary file. The file is written next to its destination first and then moved
+    into place, so concurrent readers never see a partially written file
+    """
+
+    mask_size = max(1, (len(ruleset.tiles) + 7) // 8)
+    ids = ruleset.ids
+
+    data = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(ruleset.tiles), mask_size, bytes.fromhex(key)))
+
+    for template_tile in ruleset.tiles:
+        corners = sum(1 << corner for corner, allowed in enumerate(template_tile.allowed_corners) if allowed)
+        data += TILE.pack(template_tile.tile_type.value[0], template_tile.rotation, corners)
+
+    # The connections every tile declares itself, followed by the symmetric adjacency the solver uses
+    for template_tile in ruleset.tiles:
+        for direction in Direction:
+            declared = 0
+
+            for connectable_tile in template_tile.connectable_tiles.get(direction, ()):
+                declared |= 1 << ids[connectable_tile]
+
+            data += declared.to_bytes(mask_size, "little")
+
+    for masks in ruleset.allowed:
+        for mask in masks:
+            data += mask.to_bytes(mask_size, "little")
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(data)
+
+    os.replace(file.name, path)
+
+
+def load_ruleset(path: str, key: str = None) -> Ruleset:
+    """
+    Memory-map a ruleset written by save_ruleset
+
+    :param path: The file to load
+    :param key: If given, the hash of the tile definitions the file has to have been saved with
+    :raises RulesetCacheError: If the file is not a ruleset of this format version or was saved with a different key
+    """
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if len(data) < HEADER.size:
+            raise RulesetCacheError(f"{path} is too short to be a ruleset")
+
+        magic, version, tile_count, mask_size, saved_key = HEADER.unpack_from(data, 0)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise RulesetCacheError(f"{path} is not a version {FORMAT_VERSION} ruleset")
+        if key is not None and saved_key != bytes.fromhex(key):
+            raise RulesetCacheError(f"{path} was saved for different tile definitions")
+        if len(data) != HEADER.size + tile_count * (TILE.size + 8 * mask_size):
+            raise RulesetCacheError(f"{path} is truncated")
+
+        definitions = [TILE.unpack_from(data, HEADER.size + i * TILE.size) for i in range(tile_count)]
+        offset = HEADER.size + tile_count * TILE.size
+
+        def read_masks() -> list[tuple[int, ...]]:
+            nonlocal offset
+            masks = []
+
+            for _ in range(tile_count):
+                masks.append(tuple(
+                    int.from_bytes(data[offset + d * mask_size:offset + (d + 1) * mask_size], "little")
+                    for d in range(4)
+                ))
+                offset += 4 * mask_size
+
+            return masks
+
+        declared = read_masks()
+        allowed = read_masks()
+
+    keys = [(TILE_TYPES_BY_IDENTIFIER[identifier], rotation) for identifier, rotation, _ in definitions]
+    tiles = []
+
+    for tile_id, (identifier, rotation, corners) in enumerate(definitions):
+        connectable_tiles = MappingProxyType({
+            direction: frozenset(keys[i] for i in range(tile_count) if declared[tile_id][direction.value] >> i & 1)
+            for direction in Direction
+        })
+
+        template_tile = TemplateTile(
+            TILE_TYPES_BY_IDENTIFIER[identifier],
+            connectable_tiles,
+            rotation=rotation,
+            allowed_corners=tuple(bool(corners >> corner & 1) for corner in range(4))
+        )
+        template_tile.id = tile_id
+        tiles.append(template_tile)
+
+    return Ruleset(tuple(tiles), tuple(allowed))
+
+
+def load_cached_ruleset(cache_dir: str, key: str, build: Callable[[], Ruleset]) -> Ruleset:
+    """
+    Load the ruleset cached under the key, or build and cache it if there is no valid cached ruleset
+    """
+
+    path = os.path.join(cache_dir, f"ruleset-{key[:16]}.bin")
+
+    if os.path.exists(path):
+        try:
+            return load_ruleset(path, key)
+        except (RulesetCacheError, KeyError, ValueError, OSError):
+            pass
+
+    ruleset = build()
+
+    try:
+        save_ruleset(ruleset, path, key)
+    except OSError:
+        # The cache is only an optimization, a read-only location must not stop generation
+        pass
+
+    return ruleset
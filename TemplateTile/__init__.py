@@ -1,7 +1,8 @@
 import collections
 import copy
 from enum import Enum
-from typing import Generator
+from types import MappingProxyType
+from typing import Generator, Mapping, Optional, Union
 
 from Direction import Direction
 
@@ -85,39 +86,26 @@ class TileType(Enum):
         return tiles
 
     @classmethod
-    def get_rotated_maze_tiles(cls) -> dict[str, dict[str, list[bool, bool, bool, bool]]]:
-        base_maze_tiles = cls.get_maze_tiles()
+    def get_rotated_maze_tiles(cls) -> dict[tuple['TileType', int], dict[str, list[bool, bool, bool, bool]]]:
         tiles = {}
 
-        for base_maze_tile in base_maze_tiles:
-            connections_deque = collections.deque(cls.get_connections(base_maze_tile))
-            allowed_corners_deque = collections.deque(cls.get_allowed_corners(base_maze_tile))
-
-            for rotation in range(0, base_maze_tile.value[1]):
-                tiles[TileType.get_identifier(base_maze_tile, rotation)] = {
-                    "connections": list(connections_deque),
-                    "allowed_corners": list(allowed_corners_deque)
-                }
-                connections_deque.rotate(1)
-                allowed_corners_deque.rotate(1)
+        for tile_type, rotation in ROTATED_MAZE_TILES:
+            tiles[tile_type, rotation] = {
+                "connections": cls.get_connections(tile_type, rotation),
+                "allowed_corners": list(ALLOWED_CORNERS[tile_type, rotation])
+            }
 
         return tiles
 
     @classmethod
-    def get_all_with_connection(cls, direction: Direction) -> Generator[tuple['TileType', int], None, None]:
-        maze_tiles = cls.get_rotated_maze_tiles()
-
-        for tile, obj in maze_tiles.items():
-            if obj["connections"][direction.value]:
-                yield [TileType.get_from_identifier(tile.split("_ROT_")[0]), int(tile.split("_")[-1])]
+    def get_all_with_connection(cls, direction: Direction) -> Generator[list['TileType', int], None, None]:
+        for tile_type, rotation in WITH_CONNECTION[direction]:
+            yield [tile_type, rotation]
 
     @classmethod
     def get_all_without_connection(cls, direction: Direction) -> Generator[list['TileType', int], None, None]:
-        maze_tiles = cls.get_rotated_maze_tiles()
-
-        for tile, obj in maze_tiles.items():
-            if not obj["connections"][direction.value]:
-                yield [TileType.get_from_identifier(tile.split("_ROT_")[0]), int(tile.split("_")[-1])]
+        for tile_type, rotation in WITHOUT_CONNECTION[direction]:
+            yield [tile_type, rotation]
 
     @classmethod
     def get_all_rotations(cls, tile_type: 'TileType') -> list[list['TileType', int]]:
@@ -137,59 +125,43 @@ class TileType(Enum):
         return cls[identifier.split("_ROT_")[0]]
 
     @classmethod
-    def get_connections(cls, tile_type: 'TileType', rotation: int = 0) -> list[bool, bool, bool, bool]:
-        connections = collections.deque()
-
-        match tile_type:
-            case cls.LINE:
-                connections.extend([False, True, False, True])
-            case cls.CORNER:
-                connections.extend([False, True, True, False])
-            case cls.FORK:
-                connections.extend([True, True, True, False])
-            case cls.CROSS:
-                connections.extend([True, True, True, True])
-            case cls.DEAD_END:
-                connections.extend([False, False, True, False])
-            case _:
-                return None
-
-        connections.rotate(rotation)
-        return list(connections)
+    def get_connection_mask(cls, tile_type: 'TileType', rotation: int = 0) -> Optional[int]:
+        """
+        :return: The connections as a 4 bit mask where bit direction.value is set if there is a connection in that
+            direction, None if the tile type is not a maze tile
+        """
+
+        return CONNECTION_MASKS.get((tile_type, rotation % 4))
+
+    @classmethod
+    def get_connections(cls, tile_type: 'TileType', rotation: int = 0) -> Optional[list[bool, bool, bool, bool]]:
+        mask = cls.get_connection_mask(tile_type, rotation)
+
+        if mask is None:
+            return None
+
+        return [bool(mask >> direction & 1) for direction in range(4)]
 
     @classmethod
     def get_allowed_corners(cls, tile_type: 'TileType') -> list[bool, bool, bool, bool]:
-        match tile_type:
-            case cls.LINE:
-                return [True, False, True, False]
-            case cls.CORNER:
-                return [True, False, False, True]
-            case cls.FORK:
-                return [False, False, False, True]
-            case cls.DEAD_END:
-                return [True, True, False, True]
-            case cls.CROSS:
-                return [False, False, False, False]
-            case _:
-                raise Exception(f"Tile Type {tile_type.name} does not have corners defined")
+        if tile_type not in BASE_ALLOWED_CORNERS:
+            raise Exception(f"Tile Type {tile_type.name} does not have corners defined")
+
+        return list(BASE_ALLOWED_CORNERS[tile_type])
+
+    @classmethod
+    def get_type_from_connection_mask(cls, mask: int) -> Optional[tuple['TileType', int]]:
+        return TILES_BY_CONNECTION_MASK.get(mask)
 
     @classmethod
-    def get_type_from_connections(cls, connections: list[bool, bool, bool, bool]) -> tuple['TileType', int]:
-        connections = collections.deque(connections)
-
-        for i in range(4):
-            match list(connections):
-                case [False, True, False, True]:
-                    return cls.LINE, i
-                case [False, True, True, False]:
-                    return cls.CORNER, i
-                case [True, True, True, False]:
-                    return cls.FORK, i
-                case [True, True, True, True]:
-                    return cls.CROSS, i
-                case [False, False, True, False]:
-                    return cls.DEAD_END, i
-            connections.rotate(-1)
+    def get_type_from_connections(cls, connections: list[bool, bool, bool, bool]) -> Optional[tuple['TileType', int]]:
+        mask = 0
+
+        for direction, connected in enumerate(connections):
+            if connected:
+                mask |= 1 << direction
+
+        return cls.get_type_from_connection_mask(mask)
 
     @classmethod
     def get_all_tiles(cls) -> list[list['TileType', int]]:
@@ -202,13 +174,77 @@ class TileType(Enum):
         return tile_types
 
 
+def _rotate(values: tuple, rotation: int) -> tuple:
+    # Same as collections.deque.rotate, every rotation turns the tile by 90 degrees clockwise
+    rotation %= len(values)
+    return values[-rotation:] + values[:-rotation]
+
+
+def _get_connection_mask(connections: tuple[bool, ...]) -> int:
+    return sum(1 << direction for direction, connected in enumerate(connections) if connected)
+
+
+# Connections of the maze tiles at rotation 0, indexed by direction.value
+BASE_CONNECTIONS: dict[TileType, tuple[bool, bool, bool, bool]] = {
+    TileType.LINE: (False, True, False, True),
+    TileType.CORNER: (False, True, True, False),
+    TileType.FORK: (True, True, True, False),
+    TileType.CROSS: (True, True, True, True),
+    TileType.DEAD_END: (False, False, True, False),
+}
+
+BASE_ALLOWED_CORNERS: dict[TileType, tuple[bool, bool, bool, bool]] = {
+    TileType.LINE: (True, False, True, False),
+    TileType.CORNER: (True, False, False, True),
+    TileType.FORK: (False, False, False, True),
+    TileType.DEAD_END: (True, True, False, True),
+    TileType.CROSS: (False, False, False, False),
+}
+
+# Every distinct (TileType, rotation) of the maze tiles
+ROTATED_MAZE_TILES: tuple[tuple[TileType, int], ...] = tuple(
+    (tile_type, rotation) for tile_type in BASE_CONNECTIONS for rotation in range(tile_type.value[1])
+)
+
+# (TileType, rotation) -> connection mask, for every rotation from 0 to 3 so rotations past the amount of
+# rotations of a tile type still resolve
+CONNECTION_MASKS: dict[tuple[TileType, int], int] = {
+    (tile_type, rotation): _get_connection_mask(_rotate(connections, rotation))
+    for tile_type, connections in BASE_CONNECTIONS.items() for rotation in range(4)
+}
+
+# connection mask -> (TileType, rotation)
+TILES_BY_CONNECTION_MASK: dict[int, tuple[TileType, int]] = {
+    CONNECTION_MASKS[tile]: tile for tile in ROTATED_MAZE_TILES
+}
+
+ALLOWED_CORNERS: dict[tuple[TileType, int], tuple[bool, bool, bool, bool]] = {
+    (tile_type, rotation): _rotate(BASE_ALLOWED_CORNERS[tile_type], rotation)
+    for tile_type, rotation in ROTATED_MAZE_TILES
+}
+
+WITH_CONNECTION: dict[Direction, tuple[tuple[TileType, int], ...]] = {
+    direction: tuple(tile for tile in ROTATED_MAZE_TILES if CONNECTION_MASKS[tile] >> direction.value & 1)
+    for direction in Direction
+}
+
+WITHOUT_CONNECTION: dict[Direction, tuple[tuple[TileType, int], ...]] = {
+    direction: tuple(tile for tile in ROTATED_MAZE_TILES if not CONNECTION_MASKS[tile] >> direction.value & 1)
+    for direction in Direction
+}
+
+
 class TemplateTile:
+    __slots__ = ("tile_type", "connectable_tiles", "rotation", "allowed_corners", "id")
+
     def __init__(self, tile_type: TileType, connectable_tiles: dict[Direction, list[list[TileType, int]]],
                  rotation: int, allowed_corners: list[bool]):
         self.tile_type = tile_type
         self.connectable_tiles = connectable_tiles
         self.rotation = rotation
         self.allowed_corners = allowed_corners
+        # Dense index into the TemplateTileManager, assigned when the tile is added
+        self.id: int = -1
 
     def __repr__(self):
         return f"TemplateTile<type: {self.tile_type} rotation: {self.rotation}>"
@@ -217,8 +253,11 @@ class TemplateTile:
 class TemplateTileManager:
     def __init__(self):
         self.tiles: list[TemplateTile] = []
+        self.ids: dict[tuple[TileType, int], int] = {}
 
     def add_tile(self, template_tile: TemplateTile):
+        template_tile.id = len(self.tiles)
+        self.ids[template_tile.tile_type, template_tile.rotation] = template_tile.id
         self.tiles.append(template_tile)
 
     def add_special_tile(self, tile_type: TileType, connections: dict[Direction, list[list[TileType, int]]],
@@ -265,5 +304,128 @@ class TemplateTileManager:
                 raise Exception(f"Tile Type {tile_type} was not defined")
 
     def get_template_tile(self, tile_type: TileType, rotation: int = 0) -> TemplateTile:
-        tile = list(filter(lambda t: t.tile_type == tile_type and t.rotation == rotation, self.tiles))
-        return tile[0]
+        return self.tiles[self.ids[tile_type, rotation]]
+
+    def build_adjacency_masks(self) -> list[list[int]]:
+        """
+        Precompute which template tiles may be placed next to each template tile. Two tiles may be neighbors if either
+        of them lists the other one, the same way the MazeBuilder mirrors the registered special tiles, so the
+        relation is symmetric and can be propagated in both directions
+
+        :return: allowed[tile_id][direction.value] -> bitmask of the template tile ids allowed in that direction
+        """
+
+        allowed = [[0, 0, 0, 0] for _ in self.tiles]
+
+        for template_tile in self.tiles:
+            for direction, connectable_tiles in template_tile.connectable_tiles.items():
+                for tile_type, rotation in connectable_tiles:
+                    if (tile_type, rotation) not in self.ids:
+                        continue
+
+                    neighbor_id = self.ids[tile_type, rotation]
+                    allowed[template_tile.id][direction.value] |= 1 << neighbor_id
+                    allowed[neighbor_id][direction.get_opposite().value] |= 1 << template_tile.id
+
+        return allowed
+
+    def compile(self) -> 'Ruleset':
+        """
+        Freeze the currently defined template tiles into an immutable, indexed Ruleset. Changes made to the manager
+        afterwards are not reflected in the returned Ruleset
+        """
+
+        allowed = self.build_adjacency_masks()
+        tiles = []
+
+        for template_tile in self.tiles:
+            # Only keep the connections to defined tiles, as interned (TileType, rotation) tuples
+            connectable_tiles = MappingProxyType({
+                direction: frozenset(
+                    (tile_type, rotation) for tile_type, rotation in connectable_tiles
+                    if (tile_type, rotation) in self.ids
+                )
+                for direction, connectable_tiles in template_tile.connectable_tiles.items()
+            })
+
+            frozen_tile = TemplateTile(
+                template_tile.tile_type,
+                connectable_tiles,
+                rotation=template_tile.rotation,
+                allowed_corners=tuple(template_tile.allowed_corners)
+            )
+            frozen_tile.id = template_tile.id
+            tiles.append(frozen_tile)
+
+        return Ruleset(tuple(tiles), tuple(tuple(masks) for masks in allowed))
+
+
+class Ruleset:
+    """
+    Immutable set of template tiles with dense ids and bitmask adjacency, created by TemplateTileManager.compile.
+    This is what the solver, the finisher and the renderers read from
+    """
+
+    def __init__(self, tiles: tuple[TemplateTile, ...], allowed: tuple[tuple[int, int, int, int], ...]):
+        self.tiles: tuple[TemplateTile, ...] = tiles
+        self.ids: Mapping[tuple[TileType, int], int] = MappingProxyType(
+            {(t.tile_type, t.rotation): t.id for t in tiles})
+
+        # allowed[tile_id][direction.value] -> bitmask of the template tile ids allowed in that direction
+        self.allowed: tuple[tuple[int, int, int, int], ...] = allowed
+
+        # The empty tile only marks a tile that has not been collapsed yet, so it is never a candidate
+        self.full_domain: int = self.get_mask([t for t in tiles if t.tile_type != TileType.SPECIAL_EMPTY])
+
+        # How likely every template tile is to be picked, tiles without a weight are only placed when nothing else fits
+        self.weights: tuple[int, ...] = tuple(t.tile_type.value[2] for t in tiles)
+
+        # Connection mask of every template tile, None for the tiles that are not maze tiles
+        self.connection_masks: tuple[Optional[int], ...] = tuple(
+            TileType.get_connection_mask(t.tile_type, t.rotation) for t in tiles
+        )
+
+        # connection mask -> id of the maze tile with exactly those connections, None if there is none
+        self.connection_ids: tuple[Optional[int], ...] = tuple(
+            self.ids.get(TILES_BY_CONNECTION_MASK[mask]) if mask in TILES_BY_CONNECTION_MASK else None
+            for mask in range(16)
+        )
+
+        # wall_masks[direction.value] -> bitmask of the tiles that can be placed against that wall
+        self.wall_masks: tuple[int, ...] = tuple(
+            self.get_mask([t for t in tiles if t.allowed_corners[corner]]) for corner in range(4)
+        )
+
+    def get_template_tile(self, tile_type: TileType, rotation: int = 0) -> TemplateTile:
+        return self.tiles[self.ids[tile_type, rotation]]
+
+    def get_mask(self, template_tiles: list[TemplateTile]) -> int:
+        mask = 0
+
+        for template_tile in template_tiles:
+            mask |= 1 << template_tile.id
+
+        return mask
+
+    def get_tiles_from_mask(self, mask: int) -> list[TemplateTile]:
+        tiles = []
+
+        while mask:
+            lowest_bit = mask & -mask
+            tiles.append(self.tiles[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+
+        return tiles
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __repr__(self):
+        return f"Ruleset<tiles: {len(self.tiles)}>"
+
+
+def compile_ruleset(ruleset: Union[TemplateTileManager, Ruleset]) -> Ruleset:
+    if isinstance(ruleset, TemplateTileManager):
+        return ruleset.compile()
+
+    return ruleset
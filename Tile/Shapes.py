@@ -0,0 +1,69 @@
+from typing import Callable
+
+from TemplateTile import TileType
+
+Rect = tuple[int, int, int, int]
+Color = tuple[int, int, int]
+
+BACKGROUND_COLOR: Color = (255, 255, 255)
+MAZE_COLOR: Color = (0, 0, 0)
+
+# (TileType, rotation) -> rectangles (x, y, width, height) of the path through a maze tile of cw x ch pixels,
+# relative to the top left corner of the tile. Some of them stick out of the tile by a pixel
+MAZE_SHAPES: dict[tuple[TileType, int], Callable[[int, int], list[Rect]]] = {
+    (TileType.LINE, 0): lambda cw, ch: [(0, ch // 4, cw, ch // 2)],
+    (TileType.LINE, 1): lambda cw, ch: [(cw // 4, 0, cw // 2, ch)],
+
+    (TileType.CORNER, 0): lambda cw, ch: [
+        (cw // 4, ch - ch // 2 - ch // 4, cw // 2, ch // 2 + ch // 4),
+        (cw // 4, ch // 4, cw // 2 + cw // 4 + 1, ch // 2)
+    ],
+    (TileType.CORNER, 1): lambda cw, ch: [
+        (cw // 4, ch - ch // 2 - ch // 4, cw // 2, ch // 2 + ch // 4),
+        (0, ch // 4, cw // 2 + cw // 4, ch // 2)
+    ],
+    (TileType.CORNER, 2): lambda cw, ch: [(cw // 4, 0, cw // 2, ch // 2), (-1, ch // 4, cw - cw // 4, ch // 2)],
+    (TileType.CORNER, 3): lambda cw, ch: [(cw // 4, 0, cw // 2, ch // 2), (cw // 4, ch // 4, cw - cw // 4, ch // 2)],
+
+    (TileType.CROSS, 0): lambda cw, ch: [(cw // 4, 0, cw // 2, ch), (0, ch // 4, cw, ch // 2)],
+
+    (TileType.FORK, 0): lambda cw, ch: [(cw // 4, 0, cw // 2, ch), (cw // 4, ch // 4, cw - cw // 4, ch // 2)],
+    (TileType.FORK, 1): lambda cw, ch: [
+        (0, ch // 4, cw, ch // 2),
+        (cw // 4, ch - ch // 2 - ch // 4, cw // 2, ch // 2 + ch // 4)
+    ],
+    (TileType.FORK, 2): lambda cw, ch: [(cw // 4, 0, cw // 2, ch), (-1, ch // 4, cw - cw // 4, ch // 2)],
+    (TileType.FORK, 3): lambda cw, ch: [(0, ch // 4, cw, ch // 2), (cw // 4, 0, cw // 2, ch // 2)],
+
+    (TileType.DEAD_END, 0): lambda cw, ch: [(cw // 4, ch - ch // 2 - ch // 4, cw // 2, ch // 2 + ch // 4)],
+    (TileType.DEAD_END, 1): lambda cw, ch: [(-1, ch // 4, cw - cw // 4, ch // 2)],
+    (TileType.DEAD_END, 2): lambda cw, ch: [(cw // 4, 0, cw // 2, ch - ch // 4)],
+    (TileType.DEAD_END, 3): lambda cw, ch: [(cw // 4, ch // 4, cw - cw // 4, ch // 2)],
+}
+
+# The special tiles are placeholders filling the whole tile with a single color
+BOX_COLORS: dict[TileType, Color] = {
+    TileType.SPECIAL_SINGLE_ROOM: (255, 0, 0),
+    TileType.SPECIAL_BIG_ROOM_ENTRANCE: (0, 255, 0),
+    TileType.SPECIAL_BIG_ROOM_MAIN: (0, 0, 255),
+    TileType.SPECIAL_BIG_ROOM_WALL: (122, 122, 122),
+    TileType.SPECIAL_BIG_ROOM_CORNER: (20, 20, 20),
+}
+
+# How far the shapes may stick out of their tile
+SHAPE_PADDING = 1
+
+
+def get_shape(tile_type: TileType, rotation: int, cw: int, ch: int) -> tuple[list[Rect], Color]:
+    """
+    :return: (rectangles relative to the top left corner of the tile, color) a template tile is drawn with, no
+        rectangles for the empty tile
+    """
+
+    if tile_type in BOX_COLORS:
+        return [(0, 0, cw, ch)], BOX_COLORS[tile_type]
+
+    if tile_type == TileType.SPECIAL_EMPTY:
+        return [], MAZE_COLOR
+
+    return MAZE_SHAPES[tile_type, rotation](cw, ch), MAZE_COLOR
@@ -1,312 +1,105 @@
 from __future__ import annotations
 
-import abc
 import typing
+from typing import Optional
 
 import pygame
 
 from Config import Config
-from TemplateTile import TileType
+from TemplateTile import Ruleset, TileType
+from Tile.Shapes import SHAPE_PADDING, get_shape
 
 if typing.TYPE_CHECKING:
     from Tile import Tile
 
+# Never drawn by any tile, so it marks the transparent parts of the sprites
+TRANSPARENT = (255, 0, 255)
 
-class TileRepresenter:
-    def __init__(self, tile: Tile, kwargs):
-        self.tile = tile
-        self.kwargs = kwargs
-
-    @abc.abstractmethod
-    def draw(self, screen: pygame.Surface):
-        raise NotImplemented()
-
-
-class LineRepresenter(TileRepresenter):
-    def draw(self, screen: pygame.Surface):
-        actual_x = self.tile.x * Config.CW
-        actual_y = self.tile.y * Config.CH
-
-        if self.tile.template_tile.rotation == 0:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (self.tile.x * Config.CW, self.tile.y * Config.CH + Config.CH // 4, Config.CW, Config.CH // 2)
-            )
-        elif self.tile.template_tile.rotation == 1:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (actual_x + Config.CW // 4, actual_y, Config.CW // 2, Config.CH)
-            )
-
-
-class CornerRepresenter(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        if self.tile.template_tile.rotation == 0:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH - Config.CH // 2 - Config.CH // 4,
-                    Config.CW // 2,
-                    Config.CH // 2 + Config.CH // 4
-                )
-            )
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW // 2 + Config.CW // 4 + 1,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 1:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH - Config.CH // 2 - Config.CH // 4,
-                    Config.CW // 2,
-                    Config.CH // 2 + Config.CH // 4
-                )
-            )
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW // 2 + Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 2:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH,
-                    Config.CW // 2,
-                    Config.CH // 2
-                )
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW - 1,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 3:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH,
-                    Config.CW // 2,
-                    Config.CH // 2
-                )
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-
-
-class CrossRepresenter(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        pygame.draw.rect(
-            screen,
-            (0, 0, 0),
-            (self.tile.x * Config.CW + Config.CW // 4, self.tile.y * Config.CH, Config.CW // 2, Config.CH)
-        )
-        pygame.draw.rect(
-            screen,
-            (0, 0, 0),
-            (self.tile.x * Config.CW, self.tile.y * Config.CH + Config.CH // 4, Config.CW, Config.CH // 2)
-        )
-
-
-class ForkRepresenter(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        if self.tile.template_tile.rotation == 0:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (self.tile.x * Config.CW + Config.CW // 4, self.tile.y * Config.CH, Config.CW // 2, Config.CH)
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 1:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (self.tile.x * Config.CW, self.tile.y * Config.CH + Config.CH // 4, Config.CW, Config.CH // 2)
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH - Config.CH // 2 - Config.CH // 4,
-                    Config.CW // 2,
-                    Config.CH // 2 + Config.CH // 4
-                )
-            )
-        elif self.tile.template_tile.rotation == 2:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (self.tile.x * Config.CW + Config.CW // 4, self.tile.y * Config.CH, Config.CW // 2, Config.CH)
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW - 1,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 3:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (self.tile.x * Config.CW, self.tile.y * Config.CH + Config.CH // 4, Config.CW, Config.CH // 2)
-            )
-
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH,
-                    Config.CW // 2,
-                    Config.CH // 2
-                )
-            )
-
-
-class DeadEndRepresenter(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        if self.tile.template_tile.rotation == 0:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH - Config.CH // 2 - Config.CH // 4,
-                    Config.CW // 2,
-                    Config.CH // 2 + Config.CH // 4
-                )
-            )
-        elif self.tile.template_tile.rotation == 1:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW - 1,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-        elif self.tile.template_tile.rotation == 2:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH,
-                    Config.CW // 2,
-                    Config.CH - Config.CH // 4
-                )
-            )
-        elif self.tile.template_tile.rotation == 3:
-            pygame.draw.rect(
-                screen,
-                (0, 0, 0),
-                (
-                    self.tile.x * Config.CW + Config.CW // 4,
-                    self.tile.y * Config.CH + Config.CH // 4,
-                    Config.CW - Config.CW // 4,
-                    Config.CH // 2
-                )
-            )
-
-
-class EmptyRepresenter(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        pass
-
-
-class GenericBoxPlaceholder(TileRepresenter):
-
-    def draw(self, screen: pygame.Surface):
-        pygame.draw.rect(
-            screen,
-            (self.kwargs["color"]),
-            (self.tile.x * Config.CW, self.tile.y * Config.CH, Config.CW, Config.CH)
-        )
 
+class TileAtlas:
+    """
+    Sprites of every (TileType, rotation) for one tile size, drawn once so tiles are blitted instead of drawn. Every
+    sprite has a border of SHAPE_PADDING pixels around the tile for the shapes that stick out of it
+    """
 
-class TileRepresenterBuilder:
-    representer_mapping = {
-        TileType.LINE: LineRepresenter,
-        TileType.CROSS: CrossRepresenter,
-        TileType.CORNER: CornerRepresenter,
-        TileType.DEAD_END: DeadEndRepresenter,
-        TileType.FORK: ForkRepresenter,
-        TileType.SPECIAL_EMPTY: EmptyRepresenter,
-        TileType.SPECIAL_SINGLE_ROOM: (GenericBoxPlaceholder, (255, 0, 0)),
-        TileType.SPECIAL_BIG_ROOM_ENTRANCE: (GenericBoxPlaceholder, (0, 255, 0)),
-        TileType.SPECIAL_BIG_ROOM_MAIN: (GenericBoxPlaceholder, (0, 0, 255)),
-        TileType.SPECIAL_BIG_ROOM_WALL: (GenericBoxPlaceholder, (122, 122, 122)),
-        TileType.SPECIAL_BIG_ROOM_CORNER: (GenericBoxPlaceholder, (20, 20, 20)),
-    }
+    atlases: dict[tuple[int, int], 'TileAtlas'] = {}
+
+    def __init__(self, cw: int, ch: int):
+        self.cw, self.ch = cw, ch
+        self.sprites: dict[tuple[TileType, int], Optional[pygame.Surface]] = {}
+        self.representers: dict[tuple[TileType, int], TileRepresenter] = {}
 
     @classmethod
-    def from_tile(cls, tile: Tile) -> TileRepresenter:
-        representer = cls.representer_mapping[tile.template_tile.tile_type]
-        kwargs = {}
+    def get(cls, cw: int = Config.CW, ch: int = Config.CH) -> 'TileAtlas':
+        atlas = cls.atlases.get((cw, ch))
+
+        if atlas is None:
+            atlas = cls.atlases[cw, ch] = TileAtlas(cw, ch)
+
+        return atlas
+
+    def get_sprite(self, tile_type: TileType, rotation: int) -> Optional[pygame.Surface]:
+        """
+        :return: The sprite of the tile, None for tiles that are not drawn
+        """
+
+        if (tile_type, rotation) not in self.sprites:
+            self.sprites[tile_type, rotation] = self.draw_sprite(tile_type, rotation)
+
+        return self.sprites[tile_type, rotation]
+
+    def get_representer(self, tile_type: TileType, rotation: int) -> TileRepresenter:
+        representer = self.representers.get((tile_type, rotation))
+
+        if representer is None:
+            representer = self.representers[tile_type, rotation] = TileRepresenter(self.get_sprite(tile_type, rotation))
+
+        return representer
+
+    def get_sprites(self, ruleset: Ruleset) -> list[Optional[pygame.Surface]]:
+        """
+        :return: The sprite of every template tile of the ruleset, indexed by TemplateTile.id
+        """
+
+        return [self.get_sprite(t.tile_type, t.rotation) for t in ruleset.tiles]
+
+    def draw_sprite(self, tile_type: TileType, rotation: int) -> Optional[pygame.Surface]:
+        rects, color = get_shape(tile_type, rotation, self.cw, self.ch)
 
-        if type(representer) == tuple:
-            kwargs = {"color": representer[1]}
-            representer = representer[0]
+        if not rects:
+            return None
 
-        return representer(tile, kwargs=kwargs)
+        sprite = pygame.Surface((self.cw + SHAPE_PADDING * 2, self.ch + SHAPE_PADDING * 2))
+        sprite.fill(TRANSPARENT)
+
+        for x, y, width, height in rects:
+            pygame.draw.rect(sprite, color, (x + SHAPE_PADDING, y + SHAPE_PADDING, width, height))
+
+        # Match the pixel format of the display once there is one, which makes blitting a lot faster
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+
+        sprite.set_colorkey(TRANSPARENT, pygame.RLEACCEL)
+        return sprite
+
+
+class TileRepresenter:
+    """
+    Draws the tiles of one (TileType, rotation), a single instance is shared by all of them
+    """
+
+    __slots__ = ("sprite",)
+
+    def __init__(self, sprite: Optional[pygame.Surface]):
+        self.sprite = sprite
+
+    def draw(self, screen: pygame.Surface, tile: Tile):
+        if self.sprite is not None:
+            screen.blit(self.sprite, (tile.x * Config.CW - SHAPE_PADDING, tile.y * Config.CH - SHAPE_PADDING))
+
+
+class TileRepresenterBuilder:
+    @classmethod
+    def from_tile(cls, tile: Tile) -> TileRepresenter:
+        template_tile = tile.template_tile
+        return TileAtlas.get().get_representer(template_tile.tile_type, template_tile.rotation)
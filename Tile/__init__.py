@@ -1,63 +1,104 @@
-import copy
-import random
+from __future__ import annotations
 
-from Direction import Direction
-from TemplateTile import TemplateTile, TileType
-from Tile.TileRepresenter import TileRepresenterBuilder
+import typing
+
+from TemplateTile import TemplateTile
+
+if typing.TYPE_CHECKING:
+    from Tile.TileRepresenter import TileRepresenter
+    from WFC import WaveFunctionCollapse
+
+
+class ContradictionError(Exception):
+    """
+    Raised when a tile is left without any template tile it could collapse into
+    """
+
+    def __init__(self, x: int, y: int):
+        super().__init__(x, y)
+        self.x, self.y = x, y
+
+
+class ConstraintError(ValueError):
+    """
+    Raised when constraints can't be applied, before anything was changed
+    """
+
+    def __init__(self, conflicts: list[tuple[int, int, str]]):
+        """
+        :param conflicts: (x, y, reason) of every tile the constraints conflict at
+        """
+
+        super().__init__(
+            "Conflicting constraints: " + ", ".join(f"({x}, {y}) {reason}" for x, y, reason in conflicts))
+        self.conflicts = conflicts
 
 
 class Tile:
-    def __init__(self, x: int, y: int, *, template_tile_manager, wfc):
+    """
+    View of a single tile of a WaveFunctionCollapse, the state itself lives in the arrays of the solver. Get them
+    through WaveFunctionCollapse.get_tile_at, which hands out the same view for the same tile
+    """
+
+    __slots__ = ("x", "y", "wfc", "index")
+
+    def __init__(self, x: int, y: int, *, wfc: WaveFunctionCollapse):
         self.x, self.y = x, y
-        self.available_tiles: list[TemplateTile] = copy.copy(template_tile_manager.tiles)
-        self.template_tile_manager = template_tile_manager
         self.wfc = wfc
-        self.template_tile: TemplateTile = copy.copy(template_tile_manager.get_template_tile(TileType.SPECIAL_EMPTY))
-        self.representer: TileRepresenter = None
+        self.index = x + y * wfc.width
+
+    @property
+    def ruleset(self):
+        return self.wfc.ruleset
 
     @property
-    def entropy(self):
-        return len(self.available_tiles)
+    def domain(self) -> int:
+        """
+        Bitmask over TemplateTile.id of the tiles this tile can still collapse into
+        """
+
+        return self.wfc.get_domain(self.index)
+
+    @domain.setter
+    def domain(self, domain: int):
+        self.wfc.set_domain(self.index, domain)
+
+    @property
+    def available_tiles(self) -> list[TemplateTile]:
+        return self.ruleset.get_tiles_from_mask(self.domain)
+
+    @available_tiles.setter
+    def available_tiles(self, available_tiles: list[TemplateTile]):
+        self.domain = self.ruleset.get_mask(available_tiles)
+
+    @property
+    def entropy(self) -> float:
+        return self.wfc.get_entropy(self.domain)
+
+    @property
+    def template_tile(self) -> TemplateTile:
+        return self.wfc.get_template_tile(self.index)
+
+    @property
+    def is_collapsed(self) -> bool:
+        return bool(self.wfc.collapsed[self.index])
+
+    @property
+    def representer(self) -> TileRepresenter:
+        """
+        The representer shared by every tile of the same template tile, looked up on every access so it always
+        matches the current template tile
+        """
+
+        # Imported lazily so headless runs never have to import pygame
+        from Tile.TileRepresenter import TileRepresenterBuilder
+        return TileRepresenterBuilder.from_tile(self)
 
     def set_template_tile(self, template_tile: TemplateTile):
-        self.template_tile = template_tile
-        self.representer = TileRepresenterBuilder.from_tile(self)
+        self.wfc.set_tile_at(self.x, self.y, template_tile)
 
     def collapse(self, override_type: TemplateTile = None):
-        if self.entropy == 0:
-            raise Exception(self.x, self.y)
-
-        if override_type is not None:
-            self.set_template_tile(override_type)
-        else:
-            sorted_tiles = sorted(self.available_tiles, key=lambda t: t.tile_type.value[2], reverse=True)
-            for available_tile in sorted_tiles:
-                if random.randrange(0, 100) <= available_tile.tile_type.value[2]:
-                    self.set_template_tile(available_tile)
-                    break
-            else:
-                self.set_template_tile(random.choice(sorted_tiles))
-
-        neighbors = {
-            Direction.UP: self.wfc.get_tile_at(self.x, self.y - 1),
-            Direction.RIGHT: self.wfc.get_tile_at(self.x + 1, self.y),
-            Direction.DOWN: self.wfc.get_tile_at(self.x, self.y + 1),
-            Direction.LEFT: self.wfc.get_tile_at(self.x - 1, self.y)
-        }
-
-        for direction, neighbor in neighbors.items():
-            if not neighbor:
-                continue
-
-            valid_tiles = self.template_tile.connectable_tiles[direction]
-
-            new_tiles = []
-
-            for available_tile in neighbor.available_tiles:
-                if [available_tile.tile_type, available_tile.rotation] in valid_tiles:
-                    new_tiles.append(available_tile)
-
-            neighbor.available_tiles = new_tiles
+        self.wfc.collapse(self.index, override_type)
 
     def __repr__(self):
         return f"Tile<x: {self.x}, y: {self.y}>"
@@ -1,61 +1,165 @@
+from __future__ import annotations
+
+import bisect
 import collections
+import heapq
+import itertools
+import math
 import random
 import time
-from typing import Optional
+import typing
+from typing import Iterable, Optional, Union
 
-import pygame
+import numpy
 
 from Config import Config
 from Direction import Direction
-from TemplateTile import TileType, TemplateTile, TemplateTileManager
-from Tile import Tile, TileRepresenterBuilder
+from Scheduler import StepScheduler
+from Stats import Stats
+from TemplateTile import Ruleset, TileType, TemplateTile, TemplateTileManager, compile_ruleset
+from Tile import ConstraintError, ContradictionError, Tile
+
+if typing.TYPE_CHECKING:
+    import pygame
+
+
+def get_domain_dtype(ruleset: Ruleset) -> numpy.dtype:
+    # Domains are bitmasks over the template tile ids, bigger rulesets fall back to arbitrary sized python ints
+    return numpy.dtype(numpy.uint64) if len(ruleset) <= 64 else numpy.dtype(object)
+
+
+def get_template_dtype(ruleset: Ruleset) -> numpy.dtype:
+    return numpy.dtype(numpy.int16) if len(ruleset) < 2 ** 15 else numpy.dtype(numpy.int32)
+
+
+# Entropies are queued as integers in steps of 1 / ENTROPY_SCALE, followed by JITTER_BITS random bits to break ties
+ENTROPY_SCALE = 1 << 24
+JITTER_BITS = 20
+# How many tiles outside of the window around a regenerated region are searched at most per tile of the window, to
+# find out which tiles around the region are connected to each other through the rest of the maze
+REGION_SEARCH_FACTOR = 16
+
+
+def get_view(array: numpy.ndarray) -> Union[memoryview, numpy.ndarray]:
+    # Indexing a memoryview returns plain python ints, which is a lot faster than going through numpy scalars
+    return array if array.dtype == object else memoryview(array)
 
 
 class WaveFunctionCollapse:
-    def __init__(self, template_tile_manager):
-        self.tiles: list[Tile] = []
-        self.template_tile_manager: TemplateTileManager = template_tile_manager
+    def __init__(self, ruleset: Union[Ruleset, TemplateTileManager], width: int = Config.SW // Config.CW,
+                 height: int = Config.SH // Config.CH, *, backtrack_depth: int = Config.BACKTRACK_DEPTH,
+                 max_recoveries: int = Config.MAX_RECOVERIES, walls: bool = True, domain: Optional[int] = None,
+                 rng: Optional[random.Random] = None):
+        self.ruleset: Ruleset = compile_ruleset(ruleset)
+        # Every random decision of the solver and its finisher is drawn from here, so runs with equally seeded
+        # generators produce the same maze no matter what else runs in the process
+        self.rng: random.Random = rng if rng is not None else random.Random()
+        self.width, self.height = width, height
+        self.size = width * height
         self.is_finished = False
+        # Whether the tiles at the edges of the grid have to face the wall
+        self.walls = walls
+
+        self.allowed = self.ruleset.allowed
+        # Every tile starts out with this domain, optionally narrowed down to a subset of the ruleset
+        self.full_domain = self.ruleset.full_domain if domain is None else self.ruleset.full_domain & domain
+        self.empty_tile_id = self.ruleset.get_template_tile(TileType.SPECIAL_EMPTY).id
+
+        # The state of every tile, indexed by x + y * width: the bitmask of the template tiles it can still collapse
+        # into, the id of its template tile and whether it was collapsed
+        self.domains: numpy.ndarray = numpy.full(self.size, self.full_domain, dtype=get_domain_dtype(self.ruleset))
+        self.templates: numpy.ndarray = numpy.full(self.size, self.empty_tile_id,
+                                                   dtype=get_template_dtype(self.ruleset))
+        self.collapsed: numpy.ndarray = numpy.zeros(self.size, dtype=numpy.bool_)
+        self.remaining = self.size
+
+        # Tile views are only created when they are asked for
+        self.tile_views: dict[int, Tile] = {}
+        # Sprite of every template tile, loaded on the first draw
+        self.sprites: Optional[list[Optional[pygame.Surface]]] = None
+        # Indices of the tiles whose template tile changed since they were last drawn, only tracked once a renderer
+        # asks for it by setting it to a set
+        self.changed_tiles: Optional[set[int]] = None
+
+        self._domains = get_view(self.domains)
+        self._templates = get_view(self.templates)
+        self._collapsed = get_view(self.collapsed)
+
+        # supports[direction.value][domain] -> every tile allowed in that direction by any tile in the domain
+        self.supports: list[dict[int, int]] = [{}, {}, {}, {}]
+        # domain -> Shannon entropy of the weights of its tiles and domain -> (template ids, cumulative weights) to
+        # pick a tile of the domain from, cached like the supports as the same domains come up over and over
+        self.entropies: dict[int, float] = {}
+        self.distributions: dict[int, tuple[list[int], list[int]]] = {}
+        self.propagation_visits = 0
+        # How many tiles were collapsed and how often a domain was reduced, counted whether or not stats are attached
+        self.collapses = 0
+        self.domain_reductions = 0
+
+        # Min-heap of the tiles whose domain was reduced, every entry a single integer of the quantized entropy, a
+        # random jitter and the tile index, which takes a fraction of the memory of a tuple. Entries are never removed
+        # when a tile changes, instead a new entry is pushed and the outdated one is skipped once it is popped or
+        # dropped when the heap outgrows heap_limit. Tiles that were never reduced all share the highest entropy and
+        # are picked from scan_position
+        self.entropy_heap: list[int] = []
+        self.index_bits = self.size.bit_length()
+        self.entropy_shift = self.index_bits + JITTER_BITS
+        self.heap_limit = 1024
+        # domain -> quantized entropy of the domain
+        self.entropy_levels: dict[int, int] = {}
+        self.scan_position = 0
+
+        # Trail of (tile index, old domain, old template id, was collapsed) for every change made after the first
+        # remembered decision and the decisions as (absolute trail position, tile index, chosen template id or None).
+        # Only the last backtrack_depth decisions are remembered, older parts of the trail are dropped
+        self.backtrack_depth = backtrack_depth
+        self.max_recoveries = max_recoveries
+        self.trail: Optional[collections.deque[tuple[int, int, int, bool]]] = \
+            collections.deque() if backtrack_depth > 0 else None
+        self.trail_offset = 0
+        self.decisions: collections.deque[tuple[int, int, Optional[int]]] = collections.deque()
+        self.contradictions = 0
+        self.recoveries = 0
+        self.backtracked_decisions = 0
+
+        self.scheduler = StepScheduler(self.update, lambda: self.is_finished)
+        # Times the phases of every step once attached, see Stats
+        self.stats: Optional[Stats] = None
+
+        if walls:
+            wall_masks = self.ruleset.wall_masks
+            grid = self.domains.reshape(self.height, self.width)
+            grid[:, 0] &= wall_masks[Direction.LEFT.value]
+            grid[:, -1] &= wall_masks[Direction.RIGHT.value]
+            grid[0, :] &= wall_masks[Direction.UP.value]
+            grid[-1, :] &= wall_masks[Direction.DOWN.value]
 
-        for y in range(0, Config.SH // Config.CH):
-            for x in range(0, Config.SW // Config.CW):
-                new_tile = Tile(x, y, template_tile_manager=template_tile_manager, wfc=self)
-                self.tiles.append(new_tile)
-
-                new_available_tiles = new_tile.available_tiles.copy()
-
-                if x == 0:
-                    for tile in new_tile.available_tiles:
-                        # IF IT CANT CONNECT TO LEFT WALL
-                        if not tile.allowed_corners[3] and tile in new_available_tiles:
-                            new_available_tiles.remove(tile)
-
-                if x == Config.SW // Config.CW - 1:
-                    for tile in new_tile.available_tiles:
-                        # IF IT CANT CONNECT TO RIGHT WALL
-                        if not tile.allowed_corners[1] and tile in new_available_tiles:
-                            new_available_tiles.remove(tile)
-
-                if y == 0:
-                    for tile in new_tile.available_tiles:
-                        # IF IT CANT CONNECT TO TOP WALL
-                        if not tile.allowed_corners[0] and tile in new_available_tiles:
-                            new_available_tiles.remove(tile)
-                if y == Config.SH // Config.CH - 1:
-                    for tile in new_tile.available_tiles:
-                        # IF IT CANT CONNECT TO Bottom WALL
-                        if not tile.allowed_corners[2] and tile in new_available_tiles:
-                            new_available_tiles.remove(tile)
-
-                new_tile.available_tiles = new_available_tiles
+            reduced = numpy.flatnonzero(self.domains != self.full_domain).tolist()
+
+            for index in reduced:
+                self.push_entropy(index)
+
+            self.propagate(reduced)
+
+    @property
+    def tiles(self) -> list[Tile]:
+        return [self.get_tile(index) for index in range(self.size)]
+
+    def get_tile(self, index: int) -> Tile:
+        tile = self.tile_views.get(index)
+
+        if tile is None:
+            tile = self.tile_views[index] = Tile(index % self.width, index // self.width, wfc=self)
+
+        return tile
 
     def get_tile_at(self, x: int, y: int) -> Optional[Tile]:
-        if x < 0 or x >= Config.SW // Config.CW:
+        if x < 0 or x >= self.width:
             return None
-        if y < 0 or y >= Config.SH // Config.CH:
+        if y < 0 or y >= self.height:
             return None
 
-        return self.tiles[x + y * (Config.SW // Config.CW)]
+        return self.get_tile(x + y * self.width)
 
     def get_neighbors(self, tile: Tile) -> dict[Direction, Optional[Tile]]:
         return {
@@ -65,15 +169,62 @@ class WaveFunctionCollapse:
             Direction.LEFT: self.get_tile_at(tile.x - 1, tile.y)
         }
 
+    def get_neighbor_indices(self, index: int) -> list[tuple[int, int]]:
+        """
+        :return: (direction.value, neighbor index) of every neighbor that lies inside the grid
+        """
+
+        x = index % self.width
+        neighbors = []
+
+        if index >= self.width:
+            neighbors.append((0, index - self.width))
+        if x < self.width - 1:
+            neighbors.append((1, index + 1))
+        if index + self.width < self.size:
+            neighbors.append((2, index + self.width))
+        if x > 0:
+            neighbors.append((3, index - 1))
+
+        return neighbors
+
+    def get_domain(self, index: int) -> int:
+        return self._domains[index]
+
+    def set_domain(self, index: int, domain: int):
+        self._domains[index] = domain
+
+        if not self._collapsed[index]:
+            self.push_entropy(index)
+
+    def get_template_tile(self, index: int) -> TemplateTile:
+        return self.ruleset.tiles[self._templates[index]]
+
+    def set_template(self, index: int, template_id: int, collapsed: bool = True):
+        if self._collapsed[index] != collapsed:
+            self.remaining += -1 if collapsed else 1
+
+        self._templates[index] = template_id
+        self._collapsed[index] = collapsed
+        self.mark_changed(index)
+
     def set_tile_at(self, x: int, y: int, template: TemplateTile):
-        if x < 0 or x >= Config.SW // Config.CW:
+        if x < 0 or x >= self.width:
             raise Exception("Set out of bounds")
-        if y < 0 or y >= Config.SH // Config.CH:
+        if y < 0 or y >= self.height:
             raise Exception("Set out of bounds")
 
-        self.tiles[x + y * (Config.SW // Config.CW)].template_tile = template
-        self.tiles[x + y * (Config.SW // Config.CW)].representer = TileRepresenterBuilder.from_tile(
-            self.tiles[x + y * (Config.SW // Config.CW)])
+        index = x + y * self.width
+        self._templates[index] = template.id
+        self.mark_changed(index)
+
+    def mark_changed(self, index: int):
+        """
+        Called whenever the template tile of a tile changed, so it is drawn again
+        """
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.add(index)
 
     def connect_tiles(self, connect_from: Tile, connect_to: Tile, direction: Direction):
         """
@@ -83,70 +234,849 @@ class WaveFunctionCollapse:
         :param connect_to: The second tile to connect
         """
 
-        connect_from_type = connect_from.template_tile.tile_type
-        connect_to_type = connect_to.template_tile.tile_type
+        self.connect(connect_from.index, connect_to.index, direction.value)
 
-        connect_from_connections = TileType.get_connections(
-            connect_from_type,
-            rotation=connect_from.template_tile.rotation
-        )
-        connect_to_connections = TileType.get_connections(
-            connect_to_type,
-            rotation=connect_to.template_tile.rotation
-        )
+    def connect(self, index: int, neighbor: int, direction: int):
+        """
+        Same as connect_tiles, with the indices of the tiles and the direction.value from the first to the second
+        """
+
+        from_id, to_id = self._templates[index], self._templates[neighbor]
+        from_mask, to_mask = self.ruleset.connection_masks[from_id], self.ruleset.connection_masks[to_id]
 
-        if not connect_from_connections or not connect_to_connections:
+        if from_mask is None or to_mask is None:
             raise ValueError(
                 f"First or Second tile type is not a maze tile first_tile_type: "
-                f"{connect_from_type} "
-                f"second_tile_type: {connect_to_type}")
+                f"{self.ruleset.tiles[from_id].tile_type} "
+                f"second_tile_type: {self.ruleset.tiles[to_id].tile_type}")
+
+        for index, mask in (index, from_mask | 1 << direction), (neighbor, to_mask | 1 << (direction + 2) % 4):
+            self._templates[index] = self.ruleset.connection_ids[mask]
+            self.mark_changed(index)
+
+    def add_connections(self, connections: numpy.ndarray):
+        """
+        Open up connections of many maze tiles at once, like connect does for two of them
+
+        :param connections: The connection mask to add to every tile, indexed like the tiles. 0 leaves a tile as it is
+        """
+
+        changed = numpy.flatnonzero(connections)
+        masks = numpy.array([-1 if mask is None else mask for mask in self.ruleset.connection_masks])[
+            self.templates[changed]]
+
+        if (masks < 0).any():
+            raise ValueError(f"Can't connect tiles that are not maze tiles: {changed[masks < 0].tolist()}")
+
+        ids = numpy.array([-1 if i is None else i for i in self.ruleset.connection_ids])
+        self.templates[changed] = ids[masks | connections[changed]]
+
+        # Same as mark_changed for every changed tile
+        if self.changed_tiles is not None:
+            self.changed_tiles.update(changed.tolist())
+
+    def get_support(self, domain: int, direction: Direction) -> int:
+        supports = self.supports[direction.value]
+        support = supports.get(domain)
+
+        if support is None:
+            support = 0
+
+            for template_tile in self.ruleset.get_tiles_from_mask(domain):
+                support |= self.allowed[template_tile.id][direction.value]
+
+            supports[domain] = support
+
+        return support
+
+    def get_entropy(self, domain: int) -> float:
+        entropy = self.entropies.get(domain)
+
+        if entropy is None:
+            weights = [w for w in map(self.ruleset.weights.__getitem__, self.get_ids(domain)) if w > 0]
+            total = sum(weights)
+
+            # H = log(sum(w)) - sum(w * log(w)) / sum(w), a domain of tiles without weight is as good as collapsed
+            entropy = math.log(total) - sum(w * math.log(w) for w in weights) / total if total > 0 else 0.0
+            self.entropies[domain] = entropy
+
+        return entropy
+
+    def get_distribution(self, domain: int) -> tuple[list[int], list[int]]:
+        distribution = self.distributions.get(domain)
+
+        if distribution is None:
+            ids = [i for i in self.get_ids(domain) if self.ruleset.weights[i] > 0]
+
+            if ids:
+                cumulative = list(itertools.accumulate(self.ruleset.weights[i] for i in ids))
+            else:
+                # Only tiles without a weight are left, they are all equally likely
+                ids = self.get_ids(domain)
+                cumulative = list(range(1, len(ids) + 1))
+
+            distribution = self.distributions[domain] = (ids, cumulative)
+
+        return distribution
+
+    def get_ids(self, domain: int) -> list[int]:
+        return [template_tile.id for template_tile in self.ruleset.get_tiles_from_mask(domain)]
+
+    def propagate(self, changed: list[int]) -> int:
+        """
+        Remove every template tile that can no longer be supported by its neighbors, starting from the tiles that
+        changed, until nothing changes anymore (AC-3)
+
+        :param changed: The indices of the tiles whose domain was reduced
+        :return: The amount of tiles that were visited
+        """
+
+        if self.stats is None:
+            return self.propagate_changes(changed)
+
+        start = time.perf_counter()
+
+        try:
+            return self.propagate_changes(changed)
+        finally:
+            self.stats.add_time("propagate", start)
+
+    def propagate_changes(self, changed: list[int]) -> int:
+        domains, collapsed, supports = self._domains, self._collapsed, self.supports
+        queue = collections.deque(changed)
+        queued = set(queue)
+        visits = reductions = 0
+
+        while queue:
+            index = queue.popleft()
+            queued.remove(index)
+            visits += 1
+            domain = domains[index]
+
+            for direction, neighbor in self.get_neighbor_indices(index):
+                if collapsed[neighbor]:
+                    continue
+
+                support = supports[direction].get(domain)
+
+                if support is None:
+                    support = self.get_support(domain, Direction(direction))
+
+                neighbor_domain = domains[neighbor]
+                new_domain = neighbor_domain & support
+
+                if new_domain == neighbor_domain:
+                    continue
+
+                if self.trail is not None:
+                    self.trail.append((neighbor, neighbor_domain, self._templates[neighbor], False))
+
+                domains[neighbor] = new_domain
+                reductions += 1
+
+                if new_domain == 0:
+                    self.propagation_visits += visits
+                    self.domain_reductions += reductions
+                    raise ContradictionError(neighbor % self.width, neighbor // self.width)
+
+                self.push_entropy(neighbor)
+
+                if neighbor not in queued:
+                    queue.append(neighbor)
+                    queued.add(neighbor)
+
+        self.propagation_visits += visits
+        self.domain_reductions += reductions
+        return visits
+
+    def restrict_domains(self, restrictions: dict[int, int]) -> int:
+        """
+        Intersect the domains of several tiles at once and propagate all of the reductions together
+
+        :param restrictions: tile index -> bitmask of the template tiles the tile may still collapse into
+        :return: The amount of tiles visited while propagating
+        """
+
+        return self.propagate(self.reduce_domains(restrictions))
+
+    def reduce_domains(self, restrictions: dict[int, int]) -> list[int]:
+        """
+        Intersect the domains of several tiles without propagating, collapsed tiles are skipped
+
+        :param restrictions: tile index -> bitmask of the template tiles the tile may still collapse into
+        :return: The indices of the tiles whose domain was reduced
+        :raises ContradictionError: If a domain is left empty
+        """
+
+        reduced = []
+
+        for index, mask in restrictions.items():
+            domain = self._domains[index]
+
+            if self._collapsed[index] or domain & mask == domain:
+                continue
+
+            self.record_change(index)
+            self._domains[index] = domain & mask
+            self.domain_reductions += 1
+
+            if domain & mask == 0:
+                raise ContradictionError(index % self.width, index // self.width)
+
+            self.push_entropy(index)
+            reduced.append(index)
+
+        return reduced
+
+    def get_constraint_mask(self, allowed: Union[int, TemplateTile, Iterable[TemplateTile]]) -> int:
+        if isinstance(allowed, int):
+            return allowed
+        if isinstance(allowed, TemplateTile):
+            return 1 << allowed.id
+
+        return self.ruleset.get_mask(list(allowed))
+
+    def apply_constraints(self, constraints: Iterable[tuple[int, int, Union[int, TemplateTile, Iterable[TemplateTile]]]]
+                          ) -> int:
+        """
+        Restrict many tiles at once, e.g. to place rooms and exits before solving. The constraints of every tile are
+        intersected first and then propagated together in a single pass. Tiles left with a single template tile are
+        collapsed into it
+
+        :param constraints: (x, y, allowed template tiles) as a bitmask, a template tile or several of them. A tile
+            may be constrained more than once
+        :return: The amount of tiles visited while propagating
+        :raises ConstraintError: Listing every tile the constraints conflict at, nothing is changed in that case
+        """
+
+        masks: dict[int, int] = {}
+        conflicts: list[tuple[int, int, str]] = []
+
+        for x, y, allowed in constraints:
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                conflicts.append((x, y, "is outside of the grid"))
+                continue
+
+            index = x + y * self.width
+            mask = self.get_constraint_mask(allowed)
+            masks[index] = masks[index] & mask if index in masks else mask
+
+        for index, mask in masks.items():
+            x, y = index % self.width, index // self.width
+
+            if self._collapsed[index]:
+                if not mask >> self._templates[index] & 1:
+                    conflicts.append((x, y, f"is already collapsed into {self.get_template_tile(index)}"))
+            elif self._domains[index] & mask == 0:
+                conflicts.append((x, y, "can't be any of the allowed template tiles"))
+
+        if conflicts:
+            raise ConstraintError(conflicts)
+
+        # Changes are recorded so they can be undone if propagating fails, even without backtracking
+        trail = self.trail
+
+        if trail is None:
+            self.trail = collections.deque()
+
+        position = self.trail_offset + len(self.trail)
+
+        try:
+            # Nothing is collapsed before propagating, as propagation skips collapsed tiles and would let two
+            # constrained neighbors that don't fit together through
+            reduced = self.reduce_domains(masks)
+
+            try:
+                visits = self.propagate(reduced)
+            except ContradictionError as contradiction:
+                self.undo(position)
+                contradiction, culprits = self.find_conflicting_constraints(masks, reduced, contradiction, position)
+                conflicts = [(contradiction.x, contradiction.y, "is left without any template tile")]
+                conflicts += [
+                    (index % self.width, index // self.width,
+                     f"is constrained, which together with the other constraints listed leaves ({contradiction.x}, "
+                     f"{contradiction.y}) without any template tile")
+                    for index in culprits if (index % self.width, index // self.width) != conflicts[0][:2]
+                ]
+                raise ConstraintError(conflicts) from contradiction
+
+            for index in masks:
+                domain = self._domains[index]
+
+                if not self._collapsed[index] and domain & (domain - 1) == 0:
+                    self.record_change(index)
+                    self.set_template(index, domain.bit_length() - 1)
+                    self.collapses += 1
+
+            return visits
+        finally:
+            self.trail = trail
+
+    def find_conflicting_constraints(self, masks: dict[int, int], reduced: list[int],
+                                     contradiction: ContradictionError, position: int
+                                     ) -> tuple[ContradictionError, list[int]]:
+        """
+        Narrow the constrained tiles that failed to propagate together down to a few that fail on their own. The tiles
+        are added back one at a time, nearest to the contradiction first, until propagating them fails again. The
+        tile added last is part of the conflict and is added before the others from then on, until the tiles found
+        so far fail on their own. Every change is undone afterwards
+
+        :param masks: tile index -> bitmask of the constraints of the tile
+        :param reduced: The indices of the constrained tiles whose domain the constraints reduce
+        :param contradiction: The contradiction propagating all of them together ran into
+        :param position: The absolute trail position before the constraints were applied
+        :return: The contradiction the conflicting tiles run into on their own and the conflicting tiles
+        """
+
+        order = sorted(reduced, key=lambda index: abs(index % self.width - contradiction.x) +
+                       abs(index // self.width - contradiction.y))
+        culprits: list[int] = []
+
+        try:
+            while True:
+                try:
+                    self.propagate(self.reduce_domains({index: masks[index] for index in culprits}))
+                except ContradictionError as error:
+                    return error, culprits
+
+                for index in order:
+                    if index in culprits:
+                        continue
+
+                    try:
+                        self.propagate(self.reduce_domains({index: masks[index]}))
+                    except ContradictionError:
+                        culprits.append(index)
+                        break
+                else:
+                    # Propagating in another order reaches the same domains, so this only guards against looping
+                    return contradiction, reduced
+
+                self.undo(position)
+        finally:
+            self.undo(position)
+
+    def collapse(self, index: int, override_type: TemplateTile = None):
+        domain = self._domains[index]
+
+        if domain == 0:
+            raise ContradictionError(index % self.width, index // self.width)
+
+        self.record_change(index)
+
+        if override_type is not None:
+            template_id = override_type.id
+        else:
+            ids, cumulative = self.distributions.get(domain) or self.get_distribution(domain)
+            template_id = ids[bisect.bisect(cumulative, self.rng.random() * cumulative[-1])]
+
+        self.set_template(index, template_id)
+        self._domains[index] = 1 << template_id
+        self.collapses += 1
+        self.propagate([index])
+
+    def get_entropy_level(self, domain: int) -> int:
+        level = self.entropy_levels.get(domain)
+
+        if level is None:
+            level = self.entropy_levels[domain] = max(0, round(self.get_entropy(domain) * ENTROPY_SCALE))
+
+        return level
+
+    def push_entropy(self, index: int):
+        level = self.entropy_levels.get(self._domains[index])
+
+        if level is None:
+            level = self.get_entropy_level(self._domains[index])
 
-        connect_from_connections[direction.value] = True
-        connect_to_connections[direction.get_opposite().value] = True
+        heapq.heappush(self.entropy_heap,
+                       level << self.entropy_shift | self.rng.getrandbits(JITTER_BITS) << self.index_bits | index)
 
-        new_from = TileType.get_type_from_connections(connect_from_connections)
-        new_to = TileType.get_type_from_connections(connect_to_connections)
+    def compact_entropy_heap(self):
+        """
+        Drop the entries of collapsed tiles and the outdated entries of changed tiles
+        """
+
+        domains, collapsed, levels = self._domains, self._collapsed, self.entropy_levels
+        index_mask, shift = (1 << self.index_bits) - 1, self.entropy_shift
+
+        self.entropy_heap = [entry for entry in self.entropy_heap if not collapsed[entry & index_mask] and
+                             entry >> shift == levels.get(domains[entry & index_mask])]
+        heapq.heapify(self.entropy_heap)
+        # Doubling the limit keeps the compactions linear in the pushes overall
+        self.heap_limit = max(1024, len(self.entropy_heap) * 2)
+
+    def pop_lowest_entropy_tile(self) -> Optional[int]:
+        """
+        Pop the uncollapsed tile with the lowest entropy, ties are broken by the random jitter of each heap entry
+
+        :return: The index of the tile or None if every tile has been collapsed
+        """
+
+        domains, collapsed = self._domains, self._collapsed
+
+        # Only outdated entries can be left, no need to pop them one by one
+        if self.remaining == 0:
+            self.entropy_heap.clear()
+            return None
+
+        # Outdated entries would otherwise pile up to several per tile
+        if len(self.entropy_heap) > self.heap_limit:
+            self.compact_entropy_heap()
+
+        index_mask, shift = (1 << self.index_bits) - 1, self.entropy_shift
+
+        while self.entropy_heap:
+            entry = heapq.heappop(self.entropy_heap)
+            index = entry & index_mask
+
+            if collapsed[index]:
+                continue
+
+            # The domain changed without the heap being told, queue it again with its actual entropy
+            if entry >> shift != self.entropy_levels.get(domains[index]):
+                self.push_entropy(index)
+                continue
+
+            return index
 
-        self.set_tile_at(
-            connect_from.x,
-            connect_from.y,
-            self.template_tile_manager.get_template_tile(new_from[0], new_from[1])
-        )
+        # Every tile left has never been reduced, try a few random ones before walking the grid
+        for _ in range(8):
+            index = self.rng.randrange(self.size)
 
-        self.set_tile_at(
-            connect_to.x,
-            connect_to.y,
-            self.template_tile_manager.get_template_tile(new_to[0], new_to[1])
-        )
+            if not collapsed[index]:
+                return index
+
+        while collapsed[self.scan_position]:
+            self.scan_position += 1
+
+        return self.scan_position
 
     def get_lowest_entropy_tiles(self) -> list[Tile]:
-        min_entropy = 100
+        min_entropy = math.inf
         tiles = []
 
-        for tile in self.tiles:
-            if tile.template_tile.tile_type != TileType.SPECIAL_EMPTY:
-                continue
+        for index in numpy.flatnonzero(~self.collapsed).tolist():
+            entropy = self.get_entropy(self._domains[index])
 
-            if tile.entropy < min_entropy:
+            if entropy < min_entropy:
                 tiles.clear()
-                tiles.append(tile)
-                min_entropy = tile.entropy
-            elif tile.entropy == min_entropy:
-                tiles.append(tile)
+                min_entropy = entropy
+
+            if entropy == min_entropy:
+                tiles.append(self.get_tile(index))
 
         return tiles
 
+    def record_change(self, index: int):
+        if self.trail is not None:
+            self.trail.append((index, self._domains[index], self._templates[index], self._collapsed[index]))
+
+    def begin_decision(self, index: int):
+        if self.trail is None:
+            return
+
+        self.decisions.append((self.trail_offset + len(self.trail), index, None))
+
+        if len(self.decisions) > self.backtrack_depth:
+            self.decisions.popleft()
+
+            # Forget the part of the trail that can no longer be undone
+            while self.trail_offset < self.decisions[0][0]:
+                self.trail.popleft()
+                self.trail_offset += 1
+
+    def end_decision(self, index: int):
+        if self.trail is not None and self.decisions:
+            position, _, _ = self.decisions[-1]
+            self.decisions[-1] = (position, index, self._templates[index] if self._collapsed[index] else None)
+
+    def undo(self, position: int):
+        """
+        Revert every change recorded since the absolute trail position
+        """
+
+        while self.trail_offset + len(self.trail) > position:
+            index, domain, template_id, collapsed = self.trail.pop()
+            self._domains[index] = domain
+            self.set_template(index, template_id, collapsed)
+
+            if not collapsed:
+                self.push_entropy(index)
+
+    def recover(self, contradiction: ContradictionError) -> bool:
+        """
+        Undo the most recent decisions until the template tile that was chosen last can be ruled out without causing
+        another contradiction
+
+        :return: Whether the solver could recover, False if the limits were reached
+        """
+
+        if self.trail is None or self.recoveries >= self.max_recoveries:
+            return False
+
+        undone = 0
+
+        while self.decisions and undone < self.backtrack_depth:
+            position, index, template_id = self.decisions.pop()
+            self.undo(position)
+            undone += 1
+            self.backtracked_decisions += 1
+
+            if template_id is None:
+                continue
+
+            remaining = self._domains[index] & ~(1 << template_id)
+
+            if remaining == 0:
+                continue
+
+            # Recorded as part of the previous decision, so it is reverted if that one is undone as well
+            self.record_change(index)
+            self._domains[index] = remaining
+            self.domain_reductions += 1
+            self.push_entropy(index)
+
+            try:
+                self.propagate([index])
+            except ContradictionError:
+                continue
+
+            self.recoveries += 1
+            return True
+
+        return False
+
+    def load_state(self, domains: numpy.ndarray, templates: numpy.ndarray, collapsed: numpy.ndarray):
+        """
+        Replace the state of every tile, e.g. with a part of a bigger grid that was solved elsewhere. Nothing from
+        before can be undone afterwards
+
+        :param domains: Domain of every tile, indexed by x + y * width
+        :param templates: Template tile id of every tile
+        :param collapsed: Whether every tile was collapsed
+        """
+
+        self.domains[:] = domains
+        self.templates[:] = templates
+        self.collapsed[:] = collapsed
+        self.remaining = self.size - int(numpy.count_nonzero(self.collapsed))
+        self.is_finished = False
+
+        self.entropy_heap.clear()
+        self.heap_limit = 1024
+        self.scan_position = 0
+
+        for index in numpy.flatnonzero((self.domains != self.full_domain) & ~self.collapsed).tolist():
+            self.push_entropy(index)
+
+        if self.trail is not None:
+            self.trail_offset += len(self.trail)
+            self.trail.clear()
+
+        self.decisions.clear()
+
+        if self.changed_tiles is not None:
+            self.changed_tiles.update(range(self.size))
+
+    def get_region_restrictions(self, x0: int, y0: int, x1: int, y1: int, wx0: int, wy0: int,
+                                window_width: int) -> dict[int, int]:
+        """
+        :param wx0: Column of the left edge of the window the indices are relative to
+        :param wy0: Row of the top edge of the window
+        :return: index in the window -> bitmask of the template tiles allowed next to the walls and the tiles around
+            the region, for the tiles at the edge of the region
+        """
+
+        restrictions: dict[int, int] = {}
+
+        def restrict(x: int, y: int, mask: int):
+            index = x - wx0 + (y - wy0) * window_width
+            restrictions[index] = restrictions.get(index, self.full_domain) & mask
+
+        # (direction.value from the region to the outside, tiles at that edge of the region, whether there is a wall
+        # there, offset of the tiles next to them outside of the region)
+        for direction, edge, is_wall, dx, dy in (
+            (Direction.UP.value, [(x, y0) for x in range(x0, x1)], y0 == 0, 0, -1),
+            (Direction.RIGHT.value, [(x1 - 1, y) for y in range(y0, y1)], x1 == self.width, 1, 0),
+            (Direction.DOWN.value, [(x, y1 - 1) for x in range(x0, x1)], y1 == self.height, 0, 1),
+            (Direction.LEFT.value, [(x0, y) for y in range(y0, y1)], x0 == 0, -1, 0),
+        ):
+            for x, y in edge:
+                if is_wall:
+                    if self.walls:
+                        restrict(x, y, self.ruleset.wall_masks[direction])
+                else:
+                    outside = self._templates[x + dx + (y + dy) * self.width]
+                    restrict(x, y, self.allowed[outside][(direction + 2) % 4])
+
+        return restrictions
+
+    def get_outside_links(self, x0: int, y0: int, x1: int, y1: int, wx0: int, wy0: int, wx1: int,
+                          wy1: int) -> list[tuple[int, int]]:
+        """
+        Search the maze outside of the window around a region for the tiles of the ring that are connected to each
+        other through it, breadth first from all of them at once. The search stops once they are all connected or
+        after REGION_SEARCH_FACTOR tiles per tile of the window, tiles it didn't find connected count as separate
+
+        :param wx0: Column of the left edge of the window, wx1 the column after its right edge
+        :param wy0: Row of the top edge of the window, wy1 the row after its bottom edge
+        :return: Pairs of indices in the window of tiles of the ring that are connected outside of it
+        """
+
+        from MazeFinisher.Connectivity import DisjointSet
+
+        masks, templates, width = self.ruleset.connection_masks, self._templates, self.width
+        window_width = wx1 - wx0
+
+        def get_window_index(index: int) -> Optional[int]:
+            x, y = index % width, index // width
+
+            # The corners of the ring only touch other tiles of the ring, so they are searched like the outside
+            if not (wx0 <= x < wx1 and wy0 <= y < wy1) or x in (x0 - 1, x1) and y in (y0 - 1, y1):
+                return None
+
+            return x - wx0 + (y - wy0) * window_width
+
+        def get_connected(index: int) -> list[int]:
+            mask = masks[templates[index]]
+            neighbors = []
+
+            for direction, neighbor in self.get_neighbor_indices(index):
+                neighbor_mask = masks[templates[neighbor]]
+
+                if mask >> direction & 1 and neighbor_mask is not None and neighbor_mask >> (direction + 2) % 4 & 1:
+                    neighbors.append(neighbor)
+
+            return neighbors
+
+        # outside tile index -> index in the window of the ring tile the search reached it from
+        origins: dict[int, int] = {}
+        queue: collections.deque[int] = collections.deque()
+        disjoint_set = DisjointSet(window_width * (wy1 - wy0))
+        links: list[tuple[int, int]] = []
+        groups = 0
+
+        def reach(index: int, origin: int):
+            nonlocal groups
+
+            if index not in origins:
+                origins[index] = origin
+                queue.append(index)
+            elif disjoint_set.union(origins[index], origin):
+                links.append((origins[index], origin))
+                groups -= 1
+
+        for y in range(wy0, wy1):
+            for x in range(wx0, wx1):
+                index = x + y * width
+                origin = get_window_index(index)
+
+                if origin is None or x0 <= x < x1 and y0 <= y < y1 or masks[templates[index]] is None:
+                    continue
+
+                outside = [neighbor for neighbor in get_connected(index) if get_window_index(neighbor) is None]
+                groups += bool(outside)
+
+                for neighbor in outside:
+                    reach(neighbor, origin)
+
+        budget = REGION_SEARCH_FACTOR * window_width * (wy1 - wy0)
+
+        while queue and groups > 1 and len(origins) < budget:
+            index = queue.popleft()
+            origin = origins[index]
+
+            for neighbor in get_connected(index):
+                window_index = get_window_index(neighbor)
+
+                # The tiles outside of the window only touch the ring, never the region
+                if window_index is None:
+                    reach(neighbor, origin)
+                elif disjoint_set.union(window_index, origin):
+                    links.append((window_index, origin))
+                    groups -= 1
+
+        return links
+
+    def regenerate_region(self, x0: int, y0: int, x1: int, y1: int, *, seed: Optional[int] = None,
+                          max_attempts: int = 8):
+        """
+        Collapse and finish a rectangle of a collapsed grid again, fitted to the tiles around it, which stay as they
+        are. The region is solved together with the ring of tiles around it as a grid of its own, so this costs about
+        as much as solving a grid of the region's size
+
+        The maze tiles of the region and the ring are joined through the region, opening up as few walls as possible.
+        Tiles of the ring that are connected through the rest of the maze, see get_outside_links, count as joined
+        already. Walls next to the ring are only opened up where the region leaves no other way, walls between two
+        tiles of the ring last and the corners of the ring never.
+        Attempts that leave tiles cut off or change tiles of the ring are retried like contradictions, if every attempt
+        does the one that cut off the fewest tiles and then changed the fewest is kept
+
+        :param x0: Column of the left edge of the region
+        :param y0: Row of the top edge of the region
+        :param x1: Column after the right edge of the region
+        :param y1: Row after the bottom edge of the region
+        :param seed: Seed of the new region, drawn from rng if not given
+        :param max_attempts: How often to start over with another seed after a contradiction
+        :raises ContradictionError: If no attempt fit the region to the tiles around it, the region is left as it was
+        """
+
+        from MazeFinisher.Connectivity import ConnectivityFinisher
+
+        if not (0 <= x0 < x1 <= self.width and 0 <= y0 < y1 <= self.height):
+            raise ValueError(f"The region ({x0}, {y0}) to ({x1}, {y1}) is not inside the grid")
+        if self.remaining:
+            raise ValueError("Every tile has to be collapsed before a region can be generated again")
+
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+
+        # The region and the ring of tiles around it
+        wx0, wy0, wx1, wy1 = max(x0 - 1, 0), max(y0 - 1, 0), min(x1 + 1, self.width), min(y1 + 1, self.height)
+        width, height = wx1 - wx0, wy1 - wy0
+        window = numpy.s_[wy0:wy1, wx0:wx1]
+        region = numpy.s_[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+
+        domains = self.domains.reshape(self.height, self.width)[window].copy()
+        templates = self.templates.reshape(self.height, self.width)[window].copy()
+        collapsed = numpy.ones((height, width), dtype=numpy.bool_)
+        domains[region] = self.full_domain
+        templates[region] = self.empty_tile_id
+        collapsed[region] = False
+
+        # The corners of the ring only touch other tiles of the ring, the finisher leaves them out
+        excluded = numpy.zeros((height, width), dtype=numpy.bool_)
+
+        for x, y in (x0 - 1, y0 - 1), (x1, y0 - 1), (x0 - 1, y1), (x1, y1):
+            if wx0 <= x < wx1 and wy0 <= y < wy1:
+                excluded[y - wy0, x - wx0] = True
+
+        links = self.get_outside_links(x0, y0, x1, y1, wx0, wy0, wx1, wy1)
+        restrictions = self.get_region_restrictions(x0, y0, x1, y1, wx0, wy0, width)
+        contradiction = None
+        # The attempt that left the fewest groups of maze tiles and changed the fewest tiles of the ring, with both
+        best: Optional[tuple[WaveFunctionCollapse, tuple[int, int]]] = None
+
+        for attempt in range(max_attempts):
+            wfc = WaveFunctionCollapse(self.ruleset, width, height, backtrack_depth=self.backtrack_depth,
+                                       max_recoveries=self.max_recoveries, walls=False, domain=self.full_domain,
+                                       rng=random.Random(f"{seed}:{attempt}"))
+            wfc.load_state(domains.ravel(), templates.ravel(), collapsed.ravel())
+
+            try:
+                wfc.restrict_domains(restrictions)
+                wfc.run()
+            except ContradictionError as error:
+                contradiction = ContradictionError(error.x + wx0, error.y + wy0)
+                continue
+
+            components = ConnectivityFinisher(wfc, fixed=collapsed.ravel(), excluded=excluded.ravel(),
+                                              links=links).finish().components_after
+            score = components, int(numpy.count_nonzero((wfc.templates != templates.ravel()) & collapsed.ravel()))
+
+            if best is None or score < best[1]:
+                best = wfc, score
+
+            # Special tiles of the region can cut tiles off or leave no way to join them but through the ring, which
+            # another attempt may not
+            if score <= (1, 0):
+                break
+
+        if best is None:
+            raise contradiction
+
+        wfc = best[0]
+        new_templates = wfc.templates.reshape(height, width)
+        changed = numpy.flatnonzero(new_templates != self.templates.reshape(self.height, self.width)[window])
+
+        self.domains.reshape(self.height, self.width)[window][region] = wfc.domains.reshape(height, width)[region]
+        self.templates.reshape(self.height, self.width)[window] = new_templates
+
+        for index in (changed % width + wx0 + (changed // width + wy0) * self.width).tolist():
+            self.mark_changed(index)
+
+    def solve_tile(self, index: int):
+        """
+        Collapse a single tile as the next decision, undoing earlier decisions if that leads to a contradiction. The
+        tile may be left uncollapsed when its own decision had to be undone
+        """
+
+        self.begin_decision(index)
+
+        try:
+            self.collapse(index)
+            self.end_decision(index)
+        except ContradictionError as contradiction:
+            self.contradictions += 1
+            self.end_decision(index)
+
+            if not self.recover(contradiction):
+                raise
+
     def update(self):
-        available_tiles = self.get_lowest_entropy_tiles()
+        stats = self.stats
+
+        if stats is None:
+            index = self.pop_lowest_entropy_tile()
+
+            if index is None:
+                self.is_finished = True
+                return
+
+            self.solve_tile(index)
+            return
+
+        start = time.perf_counter()
+        index = self.pop_lowest_entropy_tile()
+        stats.add_time("select", start)
 
-        if len(available_tiles) == 0:
+        if index is None:
             self.is_finished = True
             return
 
-        tile: Tile = random.choice(available_tiles)
-        tile.collapse()
+        start = time.perf_counter()
+
+        try:
+            self.solve_tile(index)
+        finally:
+            stats.add_time("collapse", start)
+
+        stats.step()
+
+    def run(self):
+        while not self.is_finished:
+            self.update()
+
+    def run_for(self, budget_ms: float) -> int:
+        """
+        Do as many updates as fit in the time budget, e.g. the time left in a frame
+
+        :return: The amount of updates done
+        """
+
+        return self.scheduler.run_for(budget_ms)
+
+    def get_sprites(self) -> list[Optional[pygame.Surface]]:
+        """
+        :return: The sprite of every template tile, indexed by TemplateTile.id
+        """
+
+        if self.sprites is None:
+            from Tile.TileRepresenter import TileAtlas
+            self.sprites = TileAtlas.get().get_sprites(self.ruleset)
+
+        return self.sprites
 
     def draw(self, screen: pygame.Surface):
-        for tile in self.tiles:
-            if tile.representer:
-                tile.representer.draw(screen)
+        from Tile.Shapes import SHAPE_PADDING
+
+        sprites = self.get_sprites()
+        indices = numpy.flatnonzero(self.templates != self.empty_tile_id)
+        xs = (indices % self.width * Config.CW - SHAPE_PADDING).tolist()
+        ys = (indices // self.width * Config.CH - SHAPE_PADDING).tolist()
+
+        template_ids = self.templates[indices].tolist()
+
+        screen.blits([(sprites[template_id], (x, y)) for template_id, x, y in zip(template_ids, xs, ys)],
+                     doreturn=False)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import collections
+import os
+import random
+from typing import Optional, Union
+
+import numpy
+
+from Config import Config
+from Direction import Direction
+from TemplateTile import Ruleset, TemplateTile, TemplateTileManager, compile_ruleset
+from Tile import ContradictionError
+from WFC import WaveFunctionCollapse
+
+# Offset of the neighboring chunk in every direction
+CHUNK_OFFSETS = {
+    Direction.UP: (0, -1),
+    Direction.RIGHT: (1, 0),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0)
+}
+
+
+class Chunk:
+    def __init__(self, cx: int, cy: int, template_ids: numpy.ndarray):
+        self.cx, self.cy = cx, cy
+        # Template tile id of every tile of the chunk, indexed by [y, x]
+        self.template_ids = template_ids
+
+    @property
+    def nbytes(self) -> int:
+        return self.template_ids.nbytes
+
+    def get_edge(self, direction: Direction) -> numpy.ndarray:
+        match direction:
+            case Direction.UP:
+                return self.template_ids[0, :]
+            case Direction.RIGHT:
+                return self.template_ids[:, -1]
+            case Direction.DOWN:
+                return self.template_ids[-1, :]
+            case Direction.LEFT:
+                return self.template_ids[:, 0]
+
+    def __repr__(self):
+        return f"Chunk<cx: {self.cx}, cy: {self.cy}>"
+
+
+class World:
+    """
+    Endless world that is generated one chunk at a time as it is visited. Every chunk is solved with the edges of the
+    already generated neighboring chunks held fixed, so chunks line up no matter in which order they are visited
+    """
+
+    def __init__(self, ruleset: Union[Ruleset, TemplateTileManager], seed: int = Config.SEED, *,
+                 chunk_size: int = Config.CHUNK_SIZE, max_cache_bytes: int = Config.CHUNK_CACHE_BYTES,
+                 persist_dir: Optional[str] = None, max_attempts: int = 8,
+                 template_tiles: Optional[list[TemplateTile]] = None):
+        """
+        :param ruleset: The template tiles to generate with
+        :param seed: Seed of the world, every chunk derives its own seed from it
+        :param chunk_size: Side length of a chunk in tiles
+        :param max_cache_bytes: How much memory the cached chunks may use before the least recently used are evicted
+        :param persist_dir: Directory evicted chunks are written to and loaded back from. Without it evicted chunks are
+            dropped and generated again, fitting the chunks around them, when they are visited again
+        :param max_attempts: How often a chunk is retried with a different seed when it can't be solved
+        :param template_tiles: The template tiles the world is made of. Defaults to every tile with a weight, tiles
+            without one (the big rooms) only fit when they are placed deliberately and can otherwise end up on two
+            chunk edges that no tile can join
+        """
+
+        self.ruleset: Ruleset = compile_ruleset(ruleset)
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.max_cache_bytes = max_cache_bytes
+        self.persist_dir = persist_dir
+        self.max_attempts = max_attempts
+
+        if template_tiles is None:
+            template_tiles = [t for t in self.ruleset.tiles if t.tile_type.value[2] > 0]
+
+        self.domain = self.ruleset.get_mask(template_tiles)
+
+        # Least recently used chunk first
+        self.chunks: collections.OrderedDict[tuple[int, int], Chunk] = collections.OrderedDict()
+        self.cache_bytes = 0
+
+        self.chunks_generated = 0
+        self.chunks_loaded = 0
+        self.chunks_evicted = 0
+
+        if persist_dir is not None:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def get_chunk_path(self, cx: int, cy: int) -> str:
+        return os.path.join(self.persist_dir, f"chunk_{self.seed}_{cx}_{cy}.npy")
+
+    def get_chunk(self, cx: int, cy: int) -> Chunk:
+        """
+        Get the chunk at the chunk coordinates, loading or generating it if it is not cached
+        """
+
+        chunk = self.chunks.get((cx, cy))
+
+        if chunk is not None:
+            self.chunks.move_to_end((cx, cy))
+            return chunk
+
+        chunk = self.load_chunk(cx, cy)
+
+        if chunk is None:
+            chunk = self.generate_chunk(cx, cy)
+        else:
+            self.chunks_loaded += 1
+
+        self.chunks[cx, cy] = chunk
+        self.cache_bytes += chunk.nbytes
+        self.evict()
+
+        return chunk
+
+    def get_template_tile_at(self, x: int, y: int) -> TemplateTile:
+        chunk = self.get_chunk(x // self.chunk_size, y // self.chunk_size)
+        return self.ruleset.tiles[chunk.template_ids[y % self.chunk_size, x % self.chunk_size]]
+
+    def load_chunk(self, cx: int, cy: int) -> Optional[Chunk]:
+        if self.persist_dir is None or not os.path.exists(self.get_chunk_path(cx, cy)):
+            return None
+
+        return Chunk(cx, cy, numpy.load(self.get_chunk_path(cx, cy)))
+
+    def peek_chunk(self, cx: int, cy: int) -> Optional[Chunk]:
+        """
+        Get a chunk that was already generated without generating it or changing the order of the cache
+        """
+
+        chunk = self.chunks.get((cx, cy))
+        return chunk if chunk is not None else self.load_chunk(cx, cy)
+
+    def evict(self):
+        # The chunk that was just added is always kept
+        while self.cache_bytes > self.max_cache_bytes and len(self.chunks) > 1:
+            (cx, cy), chunk = self.chunks.popitem(last=False)
+            self.cache_bytes -= chunk.nbytes
+            self.chunks_evicted += 1
+
+            if self.persist_dir is not None:
+                numpy.save(self.get_chunk_path(cx, cy), chunk.template_ids)
+
+    def get_edge_restrictions(self, cx: int, cy: int) -> dict[int, int]:
+        """
+        :return: tile index -> bitmask of the template tiles allowed next to the fixed edges of the neighboring chunks
+        """
+
+        size = self.chunk_size
+        restrictions: dict[int, int] = {}
+
+        for direction, (dx, dy) in CHUNK_OFFSETS.items():
+            neighbor = self.peek_chunk(cx + dx, cy + dy)
+
+            if neighbor is None:
+                continue
+
+            # The edge of the neighbor that touches this chunk
+            edge = neighbor.get_edge(direction.get_opposite()).tolist()
+            opposite = direction.get_opposite().value
+
+            for i, template_id in enumerate(edge):
+                match direction:
+                    case Direction.UP:
+                        index = i
+                    case Direction.RIGHT:
+                        index = size - 1 + i * size
+                    case Direction.DOWN:
+                        index = i + (size - 1) * size
+                    case Direction.LEFT:
+                        index = i * size
+
+                mask = self.ruleset.allowed[template_id][opposite]
+                restrictions[index] = restrictions.get(index, self.domain) & mask
+
+        return restrictions
+
+    def generate_chunk(self, cx: int, cy: int) -> Chunk:
+        restrictions = self.get_edge_restrictions(cx, cy)
+        contradiction = None
+
+        for attempt in range(self.max_attempts):
+            wfc = WaveFunctionCollapse(self.ruleset, self.chunk_size, self.chunk_size, walls=False,
+                                       domain=self.domain, rng=random.Random(f"{self.seed}:{cx}:{cy}:{attempt}"))
+
+            try:
+                wfc.restrict_domains(restrictions)
+                wfc.run()
+            except ContradictionError as error:
+                contradiction = error
+                continue
+
+            self.chunks_generated += 1
+            return Chunk(cx, cy, wfc.templates.reshape(self.chunk_size, self.chunk_size).copy())
+
+        raise contradiction
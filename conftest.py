@@ -0,0 +1 @@
+# The packages live in the root of the repository, which pytest puts on the path because of this file
@@ -0,0 +1,76 @@
+import random
+
+import numpy
+import pytest
+
+from Generator import generate
+from Generator.Batch import Job, generate_batch
+from Generator.MazeFile import MazeWriter, iter_mazes
+from MazeFinisher import MazeFinisher
+from MazeFinisher.Connectivity import ConnectivityFinisher
+from TemplateTile.Predefined import load_default_ruleset, place_big_room_entrances
+from WFC import WaveFunctionCollapse
+
+
+def solve(size: int, seed: int, big_rooms: bool = True) -> WaveFunctionCollapse:
+    wfc = WaveFunctionCollapse(load_default_ruleset(), width=size, height=size, rng=random.Random(seed))
+
+    if big_rooms:
+        place_big_room_entrances(wfc)
+
+    wfc.run()
+    return wfc
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_connectivity_finisher_joins_every_maze_tile(seed):
+    wfc = solve(30, seed, big_rooms=False)
+    finisher = ConnectivityFinisher(wfc)
+
+    assert finisher.finish().components_after == 1
+    assert ConnectivityFinisher(wfc).get_components()[1] == 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_maze_finisher_finish_matches_update(seed):
+    stepped, finished = MazeFinisher(solve(30, seed)), MazeFinisher(solve(30, seed))
+
+    while not stepped.is_finished:
+        stepped.update()
+
+    finished.finish()
+
+    assert numpy.array_equal(stepped.wfc.templates, finished.wfc.templates)
+    assert numpy.array_equal(stepped.seen, finished.seen)
+    assert (stepped.connections, stepped.backtracks) == (finished.connections, finished.backtracks)
+
+
+def test_maze_file_round_trip(tmp_path):
+    mazes = [generate(12, 9, seed) for seed in range(3)]
+    path = str(tmp_path / "mazes.bin")
+
+    with MazeWriter(path) as writer:
+        for maze in mazes:
+            writer.write(maze)
+
+    loaded = list(iter_mazes(path))
+
+    assert len(loaded) == len(mazes)
+
+    for maze, loaded_maze in zip(mazes, loaded):
+        assert (loaded_maze.width, loaded_maze.height, loaded_maze.seed) == (maze.width, maze.height, maze.seed)
+        assert numpy.array_equal(loaded_maze.template_ids, maze.template_ids)
+        assert numpy.array_equal(loaded_maze.visited, maze.visited)
+
+
+def test_generate_batch_is_independent_of_workers():
+    jobs = [Job(16, 16) for _ in range(4)] + [Job(12, 20, seed=7, big_rooms=False)]
+    single = dict(generate_batch(jobs, root_seed=3, workers=1))
+    pooled = dict(generate_batch(jobs, root_seed=3, workers=2))
+
+    assert single.keys() == pooled.keys()
+
+    for index, maze in single.items():
+        assert pooled[index].seed == maze.seed
+        assert numpy.array_equal(pooled[index].template_ids, maze.template_ids)
+        assert numpy.array_equal(pooled[index].visited, maze.visited)
@@ -0,0 +1,58 @@
+import random
+
+import numpy
+import pytest
+
+from Generator import generate
+from MazeFinisher.Connectivity import ConnectivityFinisher
+from TemplateTile import TileType
+from TemplateTile.Predefined import load_default_ruleset
+from Tile import ConstraintError, ContradictionError
+from WFC import WaveFunctionCollapse
+
+
+def load_maze(size: int, seed: int) -> WaveFunctionCollapse:
+    template_ids = generate(size, size, seed).template_ids
+    wfc = WaveFunctionCollapse(load_default_ruleset(), width=size, height=size, rng=random.Random(seed))
+    wfc.load_state(numpy.left_shift(1, template_ids.astype(numpy.uint64)).astype(wfc.domains.dtype), template_ids,
+                   numpy.ones(template_ids.size, dtype=numpy.bool_))
+    return wfc
+
+
+def test_regenerate_region_keeps_the_surroundings():
+    size = 30
+    wfc = load_maze(size, 7)
+    rng = random.Random(1)
+
+    for seed in range(30):
+        x0, y0 = rng.randrange(size), rng.randrange(size)
+        x1, y1 = min(size, x0 + rng.randrange(1, 10)), min(size, y0 + rng.randrange(1, 10))
+        before = wfc.templates.reshape(size, size).copy()
+
+        try:
+            wfc.regenerate_region(x0, y0, x1, y1, seed=seed)
+        except ContradictionError:
+            continue
+
+        changed = wfc.templates.reshape(size, size) != before
+        # Only the region and the tiles right next to it may change, not the corners of the ring around it
+        allowed = numpy.zeros((size, size), dtype=numpy.bool_)
+        allowed[y0:y1, max(x0 - 1, 0):x1 + 1] = True
+        allowed[max(y0 - 1, 0):y1 + 1, x0:x1] = True
+
+        assert not (changed & ~allowed).any()
+        assert ConnectivityFinisher(wfc).get_components()[1] == 1
+
+
+def test_apply_constraints_reports_only_the_conflict():
+    ruleset = load_default_ruleset()
+    cross = next(tile for tile in ruleset.tiles if tile.tile_type == TileType.CROSS)
+    line = next(tile for tile in ruleset.tiles if tile.tile_type == TileType.LINE and tile.rotation == 1)
+    wfc = WaveFunctionCollapse(ruleset, width=40, height=40, rng=random.Random(0))
+    domains = wfc.domains.copy()
+
+    with pytest.raises(ConstraintError) as error:
+        wfc.apply_constraints([(x, 30, cross) for x in range(5, 35)] + [(20, 10, cross), (21, 10, line)])
+
+    assert {(x, y) for x, y, _ in error.value.conflicts} == {(20, 10), (21, 10)}
+    assert numpy.array_equal(wfc.domains, domains)